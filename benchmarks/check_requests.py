@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Check that common operations work and issue only expected requests
+
+Usage:
+    PYTHONPATH=. python benchmarks/check_requests.py
+
+Requests are answered by a fake session from a static model (no jenkins server is needed),
+each check fails if an operation raised or if the issued requests differ from expected ones.
+"""
+__author__ = 'sedlacek'
+
+import json
+import sys
+import traceback
+import urllib
+from urlparse import urlparse
+
+URL = 'https://jenkins.example.com'
+
+
+class FakeResponse(object):
+
+    def __init__(self, url, data):
+        self.url = url
+        self.status_code = 200 if data is not None else 404
+        self.ok = data is not None
+        self.reason = 'OK' if data is not None else 'Not Found'
+        self.content = json.dumps(data)
+        self.headers = {'content-length': str(len(self.content))}
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """
+    Answers api/json requests from a model {path: payload}, remembers requested paths
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self.paths = []
+
+    def request(self, method, url, **kwargs):
+        path = urlparse(url).path
+        self.paths.append(path)
+        parts = [part for part in path.split('/') if part][:-2]
+        return FakeResponse(url, self._model.get('/'.join(parts)))
+
+
+def model(names):
+    """
+    :param names:       job names
+    :return dict:       {path: payload} of jenkins with jobs having one finished build
+    """
+    res = {'': {'jobs': [], 'views': []}, 'queue': {'items': []}}
+    for name in names:
+        path = 'job/%s' % urllib.quote(name.encode('utf-8'))
+        build = {'number': 1, 'url': '%s/%s/1/' % (URL, path), 'result': 'SUCCESS', 'building': False,
+                 'timestamp': 1400000000000, 'duration': 1000, 'estimatedDuration': 1000}
+        res['']['jobs'].append({'name': name, 'url': '%s/%s/' % (URL, path), 'color': 'blue',
+                                  'lastBuild': build})
+        res[path] = {'name': name, 'url': '%s/%s/' % (URL, path), 'color': 'blue',
+                     'builds': [{'number': 1, 'url': build['url']}],
+                     'firstBuild': {'number': 1, 'url': build['url']}, 'lastBuild': build}
+        res['%s/1' % path] = build
+    return res
+
+
+def jenkins(names):
+    """
+    :return:            (Jenkins instance using fake session, fake session)
+    """
+    import jenkinsapi.jenkins
+    import jenkinsapi.requester
+
+    session = FakeSession(model(names))
+    res = jenkinsapi.jenkins.Jenkins(url=URL)
+    # children use session of their parent
+    res._requester = jenkinsapi.requester.Requester(url=res.api, session=session, owner='Jenkins')
+    return res, session
+
+
+def check_non_ascii_names():
+    """
+    Non ascii job names are kept as text and url quoted in requests
+    """
+    name = u'žluťoučký kůň'
+    server, session = jenkins(['job0', name])
+    server.poll(force=True)
+    job = server.jobs[name]
+    assert job.objid == name, repr(job.objid)
+    assert job.url == '%s/job/%s' % (URL, urllib.quote(name.encode('utf-8'))), job.url
+    del session.paths[:]
+    job.poll(force=True)
+    assert session.paths == ['/job/%s/api/json' % urllib.quote(name.encode('utf-8'))], session.paths
+
+
+
+def check_hydrated_status():
+    """
+    Status of the last build hydrated from job payload is read without polling the build
+    """
+    server, session = jenkins(['job0'])
+    server.poll(force=True)
+    job = server.jobs['job0']
+    build = job.last_build
+    del session.paths[:]
+    assert build.stub
+    assert (build.ok, build.failed, build.aborted, build.isbuilding) == (True, False, False, False)
+    assert session.paths == [], session.paths
+
+
+CHECKS = [check_non_ascii_names, check_hydrated_status]
+
+if __name__ == '__main__':
+    failed = 0
+    for check in CHECKS:
+        # noinspection PyBroadException
+        try:
+            check()
+            print('%s: ok' % check.__name__)
+        except Exception:
+            failed += 1
+            print('%s: failed\n%s' % (check.__name__, traceback.format_exc()))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,100 @@
+"""
+Measure memory per tracked build with and without compact representation
+
+Usage:
+    PYTHONPATH=. python benchmarks/memory_benchmark.py [--builds 20000]
+
+Each mode runs in its own process, builds are created from synthetic api/json payloads
+(no jenkins server is needed).
+"""
+__author__ = 'sedlacek'
+
+import argparse
+import gc
+import resource
+import subprocess
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def payload(number):
+    """
+    :return dict:       payload resembling complete api/json of a finished build
+    """
+    return {
+        '_class': 'hudson.model.FreeStyleBuild',
+        'actions': [{'_class': 'hudson.model.CauseAction',
+                     'causes': [{'_class': 'hudson.model.Cause$UserIdCause',
+                                 'shortDescription': 'Started by user builder', 'userId': 'builder'}]},
+                    {'_class': 'hudson.model.ParametersAction',
+                     'parameters': [{'_class': 'hudson.model.StringParameterValue', 'name': 'BRANCH',
+                                     'value': 'master'}]}],
+        'artifacts': [{'displayPath': 'out.tar.gz', 'fileName': 'out.tar.gz', 'relativePath': 'dist/out.tar.gz'}],
+        'building': False,
+        'description': None,
+        'displayName': '#%d' % number,
+        'duration': 123456 + number,
+        'estimatedDuration': 120000,
+        'executor': None,
+        'fullDisplayName': 'benchmark #%d' % number,
+        'id': str(number),
+        'keepLog': False,
+        'number': number,
+        'queueId': 100000 + number,
+        'result': 'SUCCESS',
+        'timestamp': 1400000000000 + number,
+        'url': 'https://jenkins.example.com/job/benchmark/%d/' % number,
+        'builtOn': 'slave-%d' % (number % 16),
+        'changeSet': {'_class': 'hudson.scm.EmptyChangeLogSet', 'items': [], 'kind': None},
+    }
+
+
+def measure(mode, builds):
+    """
+    Create builds in this process
+    :return float:      bytes per build
+    """
+    import jenkinsapi.jenkins
+    import jenkinsapi.jenkinsjob
+    import jenkinsapi.jenkinsbuild
+
+    jenkinsapi.jenkinsbuild.JenkinsBuild._COMPACT = mode == 'compact'
+    job = jenkinsapi.jenkinsjob.JenkinsJob(url='https://jenkins.example.com/job/benchmark')
+
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # builds registry keeps only limited number of builds alive, so we hold all of them ourselves
+    tracked = []
+    for number in range(1, builds + 1):
+        # payload is created as it would be parsed from response, only retained part stays in memory
+        data = payload(number)
+        tracked.append(jenkinsapi.jenkinsbuild.JenkinsBuild(parent=job, url=data['url'], data=data))
+    del data
+    gc.collect()
+    if tracemalloc is not None:
+        used = tracemalloc.get_traced_memory()[0]
+    else:
+        # ru_maxrss is in kB on linux, it includes the last transient payload, negligible for many builds
+        used = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024
+    return float(used) / builds
+
+
+parser = argparse.ArgumentParser(description='Benchmark memory used per tracked build')
+parser.add_argument('--builds', type=int, default=20000, metavar='<builds>', help='number of builds')
+parser.add_argument('--mode', default=None, choices=('raw', 'compact'), help=argparse.SUPPRESS)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.mode is not None:
+        print('%f' % measure(args.mode, args.builds))
+    else:
+        for mode in ('raw', 'compact'):
+            output = subprocess.check_output([sys.executable, __file__, '--builds', str(args.builds),
+                                              '--mode', mode])
+            print('%-8s %10.0f B/build' % (mode, float(output.strip().splitlines()[-1])))
@@ -0,0 +1,128 @@
+"""
+Compare parsing of api/json and api/python payloads
+
+Usage:
+    PYTHONPATH=. python benchmarks/parse_benchmark.py [--json recorded.json --python recorded.py] [--jobs 20000]
+
+Without recorded payloads a synthetic root (jenkins) payload with --jobs jobs is generated.
+Each format is parsed in its own process from a file, so peak memory of generating the payload
+or parsing the other format does not hide the measured one.
+"""
+__author__ = 'sedlacek'
+
+import argparse
+import gc
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from ast import literal_eval
+
+import jenkinsapi.jenkins          # import order matters, jenkinsbase cannot be imported first
+import jenkinsapi.jenkinsbase
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def synthetic_payload(jobs):
+    """
+    :param int jobs:        number of jobs in generated payload
+    :return dict:           payload looking like jenkins root object with jobs and their last builds
+    """
+    return {
+        'jobs': [{
+            'name': 'job-%d' % i,
+            'url': 'https://jenkins.example.com/job/job-%d/' % i,
+            'color': 'blue' if i % 3 else 'red',
+            'lastBuild': {'number': i, 'url': 'https://jenkins.example.com/job/job-%d/%d/' % (i, i),
+                          'result': 'SUCCESS', 'building': False, 'timestamp': 1400000000000 + i,
+                          'duration': 1000 + i},
+        } for i in range(jobs)],
+        'views': [],
+    }
+
+
+def measure(parse, content, repeat):
+    """
+    Parse content in this process
+    :return tuple:          best parse time in seconds, peak memory of parsing in bytes
+    """
+    # peak memory first, timing below would raise the high water mark
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    parsed = parse(content)
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        # ru_maxrss is in kB on linux
+        peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024
+    del parsed
+
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        parse(content)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, peak
+
+
+def formats():
+    """
+    :return list:           [(format, description, parse function)]
+    """
+    return [('json', 'api/json (%s)' % jenkinsapi.jenkinsbase.json_loads.__module__,
+             jenkinsapi.jenkinsbase.json_loads),
+            ('python', 'api/python (literal_eval)', literal_eval)]
+
+
+def write_synthetic(jobs, directory):
+    """
+    :return tuple:          paths of generated api/json and api/python payloads
+    """
+    payload = synthetic_payload(jobs)
+    paths = os.path.join(directory, 'api.json'), os.path.join(directory, 'api.py')
+    for path, content in zip(paths, (json.dumps(payload), repr(payload))):
+        with open(path, 'wb') as f:
+            f.write(content)
+    return paths
+
+
+parser = argparse.ArgumentParser(description='Benchmark api/json vs api/python parsing')
+parser.add_argument('--json', default=None, metavar='<file>', help='recorded api/json payload')
+parser.add_argument('--python', default=None, metavar='<file>', help='recorded api/python payload')
+parser.add_argument('--jobs', type=int, default=20000, metavar='<jobs>', help='jobs in synthetic payload')
+parser.add_argument('--repeat', type=int, default=5, metavar='<repeat>', help='repeat each measurement')
+parser.add_argument('--format', default=None, choices=('json', 'python'), help=argparse.SUPPRESS)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.format is not None:
+        parse = dict((fmt, parse) for fmt, _, parse in formats())[args.format]
+        with open(args.json if args.format == 'json' else args.python, 'rb') as f:
+            content = f.read()
+        elapsed, peak = measure(parse, content, args.repeat)
+        print('%d %f %d' % (len(content), elapsed, peak))
+    else:
+        directory = tempfile.mkdtemp()
+        try:
+            if args.json is None or args.python is None:
+                args.json, args.python = write_synthetic(args.jobs, directory)
+            for fmt, name, _ in formats():
+                output = subprocess.check_output([sys.executable, __file__, '--format', fmt, '--repeat',
+                                                  str(args.repeat), '--json', args.json, '--python', args.python])
+                size, elapsed, peak = output.strip().splitlines()[-1].split()
+                print('%-32s size: %10d B  parse: %8.3f ms  peak: %d B' % (
+                    name, int(size), float(elapsed) * 1000, int(peak)))
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,185 @@
+"""
+Stress registries of jobs, builds and queue items from many threads
+
+Usage:
+    PYTHONPATH=. python benchmarks/stress_registry.py [--threads 32] [--operations 2000] [--latency 0.002]
+        [--poll-interval 60]
+
+Threads mix get-or-create of jobs, builds and queue items with forced polls of jenkins, jobs and the queue.
+Requests are answered by a fake session (no jenkins server is needed), each of them takes latency seconds.
+Objects are created with poll interval, so their constructors poll (when poll interval is not 0).
+Benchmark fails if any operation raised, if get-or-create returned two different instances for the same
+object, or if a request has been issued while holding the registry lock.
+"""
+__author__ = 'sedlacek'
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import traceback
+from urlparse import urlparse
+
+URL = 'https://jenkins.example.com'
+
+
+class FakeResponse(object):
+
+    def __init__(self, url, data):
+        self.url = url
+        self.status_code = 200 if data is not None else 404
+        self.ok = data is not None
+        self.reason = 'OK' if data is not None else 'Not Found'
+        self.content = json.dumps(data)
+        self.headers = {'content-length': str(len(self.content))}
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """
+    Answers api/json requests of jenkins, its jobs, builds and queue, new build is started from time to time
+    """
+
+    def __init__(self, jobs, latency, registry_lock):
+        self._jobs = jobs
+        self._latency = latency
+        self._registry_lock = registry_lock
+        self._lock = threading.Lock()
+        self._last = dict(('job%d' % job, 10) for job in range(jobs))
+        self.requests = 0
+        self.locked_requests = 0
+
+    def _build(self, name, number):
+        return {'number': number, 'url': '%s/job/%s/%d/' % (URL, name, number), 'result': None,
+                'building': number == self._last[name], 'timestamp': 1400000000000 + number,
+                'duration': 0, 'estimatedDuration': 1000}
+
+    def _job(self, name):
+        last = self._last[name]
+        return {'name': name, 'url': '%s/job/%s/' % (URL, name), 'color': 'blue',
+                'builds': [{'number': number, 'url': '%s/job/%s/%d/' % (URL, name, number)}
+                           for number in range(last, 0, -1)],
+                'firstBuild': {'number': 1, 'url': '%s/job/%s/1/' % (URL, name)},
+                'lastBuild': self._build(name, last)}
+
+    def _payload(self, path):
+        parts = [part for part in path.split('/') if part]
+        if parts == ['api', 'json']:
+            return {'jobs': [dict((key, value) for key, value in self._job(name).iteritems()
+                                  if key in ('name', 'url', 'color', 'lastBuild')) for name in sorted(self._last)]}
+        if parts == ['queue', 'api', 'json']:
+            return {'items': [{'id': number, 'url': 'queue/item/%d/' % number, 'cancelled': False,
+                               'task': {'name': 'job0', 'url': '%s/job/job0/' % URL, 'color': 'blue'},
+                               'executable': None, 'actions': []} for number in range(1, 6)]}
+        if parts[0] == 'queue' and len(parts) == 5:
+            return {'id': int(parts[2]), 'url': 'queue/item/%s/' % parts[2], 'cancelled': False,
+                    'executable': None, 'actions': []}
+        if parts[0] == 'job' and parts[1] in self._last:
+            if len(parts) == 4:
+                return self._job(parts[1])
+            if len(parts) == 5 and parts[2].isdigit() and 0 < int(parts[2]) <= self._last[parts[1]]:
+                return self._build(parts[1], int(parts[2]))
+        return None
+
+    def request(self, method, url, **kwargs):
+        if self._registry_lock._is_owned():
+            self.locked_requests += 1
+        time.sleep(self._latency)
+        with self._lock:
+            self.requests += 1
+            if random.random() < 0.01:
+                # somebody has started a build
+                self._last[random.choice(sorted(self._last))] += 1
+            return FakeResponse(url, self._payload(urlparse(url).path))
+
+
+def stress(threads, operations, jobs, latency, poll_interval):
+    """
+    :return int:        number of detected problems
+    """
+    import jenkinsapi.jenkins
+    import jenkinsapi.jenkinsbase
+    import jenkinsapi.jenkinsjob
+    import jenkinsapi.jenkinsbuild
+    import jenkinsapi.jenkinsqueueitem
+    import jenkinsapi.requester
+
+    session = FakeSession(jobs, latency, jenkinsapi.jenkinsbase.REGISTRY_LOCK)
+    jenkins = jenkinsapi.jenkins.Jenkins(url=URL)
+    # children use session of their parent
+    jenkins._requester = jenkinsapi.requester.Requester(url=jenkins.api, session=session, owner='Jenkins')
+
+    seen = {}                   # {key: first instance returned}, keeps instances alive, so identity must hold
+    seen_lock = threading.Lock()
+    problems = []
+
+    def check(key, obj):
+        with seen_lock:
+            first = seen.setdefault(key, obj)
+        if first is not obj:
+            problems.append('%s: two instances %r and %r' % (key, first, obj))
+
+    def job(name):
+        res = jenkinsapi.jenkinsjob.JenkinsJob(parent=jenkins, objid=name, poll_interval=poll_interval)
+        check(('job', name), res)
+        return res
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        for _ in range(operations):
+            name = 'job%d' % rnd.randrange(jobs)
+            action = rnd.randrange(6)
+            # noinspection PyBroadException
+            try:
+                if action == 0:
+                    job(name)
+                elif action == 1:
+                    number = str(rnd.randrange(1, 11))
+                    check(('build', name, number), jenkinsapi.jenkinsbuild.JenkinsBuild(
+                        parent=job(name), objid=number, poll_interval=poll_interval))
+                elif action == 2:
+                    itemid = str(rnd.randrange(1, 6))
+                    check(('item', itemid), jenkinsapi.jenkinsqueueitem.JenkinsQueueItem(
+                        parent=jenkins, objid=itemid, poll_interval=poll_interval))
+                elif action == 3:
+                    jenkins.poll(force=True)
+                elif action == 4:
+                    job(name).poll(force=True)
+                else:
+                    jenkins.queue.poll(force=True)
+            except Exception:
+                problems.append(traceback.format_exc())
+
+    start = time.time()
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+
+    if session.locked_requests:
+        problems.append('%d requests issued under registry lock' % session.locked_requests)
+    print('%d threads, %d operations in %.2fs (%.0f ops/s), %d requests, %d objects'
+          % (threads, threads * operations, elapsed, threads * operations / elapsed, session.requests, len(seen)))
+    for problem in problems[:10]:
+        print(problem)
+    print('%d problems' % len(problems))
+    return len(problems)
+
+
+parser = argparse.ArgumentParser(description='Stress registries of jenkins objects from many threads')
+parser.add_argument('--threads', type=int, default=32, metavar='<threads>', help='number of threads')
+parser.add_argument('--operations', type=int, default=2000, metavar='<operations>', help='operations per thread')
+parser.add_argument('--jobs', type=int, default=20, metavar='<jobs>', help='number of jobs')
+parser.add_argument('--latency', type=float, default=0.002, metavar='<seconds>', help='latency of each request')
+parser.add_argument('--poll-interval', type=float, default=60, metavar='<seconds>',
+                    help='poll interval of created objects')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sys.exit(1 if stress(args.threads, args.operations, args.jobs, args.latency, args.poll_interval) else 0)
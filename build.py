@@ -3,8 +3,10 @@ __author__ = 'sedlacek'
 from jenkinsapi.jenkins import Jenkins
 from jenkinsapi.jenkinsjob import JenkinsJob
 from jenkinsapi.requester import JenkinsAuth
+import jenkinsapi.requester
 
 import re
+import os.path
 
 import logging
 
@@ -85,6 +87,8 @@ parser.add_argument('--noconsole', action='store_true', help='do no copy console
 parser.add_argument('--cause', required=False, default=None,  metavar='<cause>', help='build cause')
 parser.add_argument('--level', required=False, default='WARNING',  metavar='<debug level>', help='Debug Level')
 parser.add_argument('--artifacts', required=False, default=None, metavar='<artifacts>', help='Artifacts to download (regex) or ALL')
+parser.add_argument('--sslcache', required=False, default=os.path.join(os.path.expanduser('~'), '.jenkinsapi-ssl.json'),
+                    metavar='<sslcache>', help='file caching detected ssl versions, empty string disables it')
 parser.add_argument('params', metavar='param1=value', nargs='*', help='build parameters, file type param2=@filename')
 
 
@@ -92,6 +96,9 @@ args = vars(parser.parse_args())
 
 logging.basicConfig(level=args['level'].upper())
 
+if args['sslcache']:
+    jenkinsapi.requester.SSL_CACHE_FILE = args['sslcache']
+
 jenkins = Jenkins(url=args['jenkins'], auth=JenkinsAuth(username=args['user'], password=args['password'], token=args['token']))
 job = JenkinsJob(parent=jenkins, objid=args['job'])
 
@@ -0,0 +1,942 @@
+import codecs
+import heapq
+import json
+import os
+import re
+import threading
+import zlib
+from collections import deque, namedtuple
+from Queue import Queue, Empty, Full
+from time import sleep, time
+import jenkinsapi.misc
+import jenkinsapi.consoleindex
+
+import logging
+logger = logging.getLogger(__name__)
+
+# zstd compression of console sink is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__author__ = 'sedlacek'
+
+CONSOLE_CHUNK_SIZE = 65536          # bytes read from progressive text response at once
+CONSOLE_MAX_LINE = 1048576          # longer lines are yielded in pieces, so memory stays bounded
+CONSOLE_POLL_CEILING = 30           # longest wait between polls of idle console
+CONSOLE_POLL_FACTOR = 2             # backoff factor of idle console polling
+CONSOLE_CHECKPOINT_INTERVAL = 1     # min seconds between writes of resume offset file
+SINK_CHECKPOINT_BYTES = 4194304     # console sink checkpoints at least after so many console bytes
+SINK_CHECKPOINT_INTERVAL = 10       # or after so many seconds
+TAIL_LINE_ESTIMATE = 128            # expected bytes per line when looking for the last lines of console
+MULTIPLEX_WORKERS = 4               # threads of ConsoleMultiplexer
+MULTIPLEX_BUFFER = 10000            # lines buffered by ConsoleMultiplexer before workers stop reading
+MULTIPLEX_FAIRNESS = 4              # every n-th request of ConsoleMultiplexer goes to idle build, if one is due
+PATTERN_MAX_GROUPS = 90             # python 2 re supports at most 100 groups in a regex
+
+# match found by ConsoleReader.search, offset is console offset of the line
+ConsoleMatch = namedtuple('ConsoleMatch', ('name', 'line', 'match', 'offset'))
+
+
+class ConsoleReader(object):
+    """
+    Streaming reader of build's progressive console text (logText/progressiveText)
+
+    Responses are consumed in chunks of chunk_size bytes, so memory is bounded regardless of the log size.
+    Lines spanning chunk (and response) boundaries are reassembled, multibyte characters split between chunks
+    are decoded correctly. Position is kept in the build, so next reader (or JenkinsBuild.console) continues
+    where this one stopped.
+
+    Polling is adaptive - while server returns data, next request is issued immediately, when console is idle
+    waits grow exponentially from poll_interval up to ceiling and drop back once output resumes.
+
+    Usage:
+        for line in build.console_reader(encoding='utf-8').iter_lines():
+            ...
+    """
+
+    def __init__(self, build, start=None, poll_interval=1, encoding=None, errors='replace',
+                 chunk_size=None, max_line=None, ceiling=None, resume=None):
+        """
+        :param JenkinsBuild build:      build whose console we read
+        :param int start:               byte offset to start from, None means continue from build's last position
+        :param poll_interval:           seconds to wait when there are no new data yet (first wait of backoff),
+                                        0 or None means no waiting, None is yielded instead
+        :param str encoding:            decode lines to unicode, None means lines are byte strings
+        :param str errors:              decoding error handling
+        :param int chunk_size:          bytes read at once, default CONSOLE_CHUNK_SIZE
+        :param int max_line:            longer lines are split, default CONSOLE_MAX_LINE
+        :param float ceiling:           longest wait of idle console, default CONSOLE_POLL_CEILING,
+                                        ceiling=poll_interval means fixed poll interval
+        :param str resume:              file persisting offset of consumed data, when start is None
+                                        reading continues from the stored offset
+        """
+        self._build = build
+        self._url = jenkinsapi.misc.normalize_url(jenkinsapi.misc.join_url(build.url, 'logText/progressiveText'))
+        self._checkpoint = OffsetCheckpoint(resume) if resume is not None else None
+        self._checkpointed = 0
+        if start is None and self._checkpoint is not None:
+            checkpoint = self._checkpoint.load(self._url)
+            if checkpoint is not None:
+                start = checkpoint['offset']
+                logger.info(' Resuming console %s from offset %d' % (self._url, start))
+        if start is not None:
+            self.seek(start)
+        self._poll_interval = poll_interval
+        self._encoding = encoding
+        self._errors = errors
+        self._chunk_size = jenkinsapi.misc.default(chunk_size, CONSOLE_CHUNK_SIZE)
+        self._max_line = jenkinsapi.misc.default(max_line, CONSOLE_MAX_LINE)
+        self._ceiling = max(jenkinsapi.misc.default(ceiling, CONSOLE_POLL_CEILING), poll_interval or 0)
+        self._stats = {'requests': 0, 'empty': 0, 'bytes': 0, 'waited': 0.0}
+
+    @property
+    def offset(self):
+        """
+        :return int:        bytes of console consumed so far
+        """
+        return self._build._console_text_size
+
+    @property
+    def more(self):
+        """
+        :return bool:       False if build finished and whole console has been read
+        """
+        return self._build._console_more_data
+
+    def seek(self, offset):
+        """
+        Continue reading from byte offset
+        :return:            self
+        """
+        self._build._console_text_size = offset
+        self._build._console_more_data = True
+        return self
+
+    def size(self):
+        """
+        Discover current console size (x-text-size), console itself is not downloaded
+        :return int:        size in bytes
+        """
+        response = self._build.requester.post(url=self._url, data={'start': self.offset},
+                                              idempotent=True, stream=True)
+        self._stats['requests'] += 1
+        try:
+            return int(response.headers['x-text-size'])
+        except Exception as e:
+            raise ValueError('Cannot get console text size :(%s)' % str(e))
+        finally:
+            # we do not read the body
+            response.close()
+
+    def tail_bytes(self, count):
+        """
+        Position reader count bytes before the current end of console
+        :return:            self
+        """
+        return self.seek(max(0, self.size() - count))
+
+    def tail_lines(self, count):
+        """
+        Read last count lines of console, only the end of console is downloaded.
+        Reader is positioned behind the last complete line, so it can continue following the console.
+
+        :return list:       last lines (without line terminators)
+        """
+        end = self.size()
+        window = max(count, 1) * TAIL_LINE_ESTIMATE
+        while True:
+            start = max(0, end - window)
+            self.seek(start)
+            lines = ''.join(self.fetch()).split('\n')
+            if start > 0:
+                # the first line is most probably incomplete
+                lines.pop(0)
+            if len(lines) > count or start == 0:
+                break
+            window *= 4
+        last = lines.pop()
+        if last and self.more:
+            # incomplete last line, leave it for following
+            self.seek(self.offset - len(last))
+        elif last:
+            lines.append(last)
+        splitter = LineSplitter(encoding=self._encoding, errors=self._errors, max_line=self._max_line)
+        return [splitter._line(line) for line in lines[-count:]] if count > 0 else []
+
+    def save(self, offset=None, force=True):
+        """
+        Persist resume offset (if reader has resume file)
+        :param int offset:      offset of data consumed, default is self.offset
+        :param bool force:      save regardless of CONSOLE_CHECKPOINT_INTERVAL
+        """
+        if self._checkpoint is None:
+            return
+        now = time()
+        if force or now - self._checkpointed >= CONSOLE_CHECKPOINT_INTERVAL:
+            self._checkpoint.save(self._url, jenkinsapi.misc.default(offset, self.offset))
+            self._checkpointed = now
+
+    def stats(self):
+        """
+        :return dict:       requests, empty (requests without new data), bytes, waited (seconds spent waiting)
+                            and requests_per_byte (None until first byte arrives)
+        """
+        stats = dict(self._stats)
+        stats['requests_per_byte'] = float(stats['requests']) / stats['bytes'] if stats['bytes'] else None
+        return stats
+
+    def fetch(self):
+        """
+        Single progressive text request, yield raw byte chunks of new console data (nothing if there are none)
+        """
+        response = self._build.requester.post(url=self._url, data={'start': self.offset},
+                                              idempotent=True, stream=True)
+        self._stats['requests'] += 1
+        try:
+            try:
+                # Should we expect more data?
+                more = response.headers['x-more-data'] == 'true'
+            except KeyError:
+                more = False
+            try:
+                size = int(response.headers['x-text-size'])
+            except Exception as e:
+                # broken console protocol, lets raise an exception here
+                raise ValueError('Cannot get console text size :(%s)' % str(e))
+            logger.debug('console: x-text-size=%d, x-more-data=%s' % (size, more))
+
+            if size == self.offset:
+                # we did not receive any update ...
+                self._stats['empty'] += 1
+            else:
+                for chunk in response.iter_content(self._chunk_size):
+                    if chunk:
+                        self._build._console_text_size += len(chunk)
+                        self._stats['bytes'] += len(chunk)
+                        yield chunk
+                self._build._console_text_size = size
+            # only whole response has been consumed
+            self._build._console_more_data = more
+        finally:
+            response.close()
+
+    def iter_chunks(self, checkpoint=True):
+        """
+        yield raw byte chunks of console, or None if there are no new data and polling is off
+        or raise jenkinsapi.misc.JenkinsNoMoreConsoleData if we already read everything
+
+        :param bool checkpoint:     persist offset of chunks consumed by caller into resume file
+        """
+        if not self.more:
+            # well, we are behind the end
+            raise jenkinsapi.misc.JenkinsNoMoreConsoleData
+
+        wait = None
+        if self._poll_interval:
+            wait = jenkinsapi.misc.AdaptiveWait(floor=self._poll_interval, ceiling=self._ceiling,
+                                                factor=CONSOLE_POLL_FACTOR)
+        while self.more:
+            offset = self.offset
+            for chunk in self.fetch():
+                yield chunk
+                if checkpoint:
+                    self.save(force=False)
+            if checkpoint:
+                self.save(force=not self.more)
+            if self.offset != offset:
+                # output is flowing, next request goes out immediately
+                if wait is not None:
+                    wait.reset()
+            elif not self.more:
+                # nothing more to process...
+                break
+            elif wait is None:
+                # well we do not want to do polling here, so yield None
+                yield None
+            else:
+                # lets wait (longer and longer) and poll again
+                seconds = wait.next()
+                self._stats['waited'] += seconds
+                sleep(seconds)
+
+    def iter_lines(self, offsets=False):
+        """
+        yield console lines (without line terminators), or None if there are no new data and polling is off
+        or raise jenkinsapi.misc.JenkinsNoMoreConsoleData if we already read everything
+
+        :param bool offsets:        yield (line, console offset of the line) instead of lines
+        """
+        splitter = LineSplitter(encoding=self._encoding, errors=self._errors, max_line=self._max_line,
+                                start=self.offset)
+        consumed = self.offset
+        try:
+            for chunk in self.iter_chunks(checkpoint=False):
+                if chunk is None:
+                    yield None
+                    continue
+                for line, end in zip(splitter.feed(chunk), splitter.ends):
+                    yield (line, consumed) if offsets else line
+                    # caller is back, so it has consumed the line
+                    consumed = end
+                    self.save(consumed, force=False)
+            for line, end in zip(splitter.flush(), splitter.ends):
+                yield (line, consumed) if offsets else line
+                consumed = end
+        finally:
+            # remember what caller has consumed, even if it stopped reading
+            self.save(consumed)
+
+    def search(self, patterns, callback=None, stop=True):
+        """
+        Scan console lines for patterns while following the console, all patterns are matched in a single pass
+        (see PatternSet). If polling is off, scanning ends when there are no new data.
+
+        :param patterns:            PatternSet, dict {name: pattern} or list of patterns (strings or compiled)
+        :param callback:            callable(ConsoleMatch), returning True stops following
+        :param bool stop:           stop following console on the first match
+        :return ConsoleMatch:       first match or None
+        """
+        if not isinstance(patterns, PatternSet):
+            patterns = PatternSet(patterns)
+        first = None
+        lines = self.iter_lines(offsets=True)
+        try:
+            for item in lines:
+                if item is None:
+                    break
+                line, offset = item
+                found = patterns.search(line)
+                if found is None:
+                    continue
+                match = ConsoleMatch(found[0], line, found[1], offset)
+                if first is None:
+                    first = match
+                if callback is not None and callback(match):
+                    break
+                if stop:
+                    break
+        finally:
+            # stop following, response is closed and consumed offset saved
+            lines.close()
+        return first
+
+
+class LineSplitter(object):
+    """
+    Splits stream of byte chunks to lines, lines spanning chunks are reassembled
+
+    Stream is split on newline bytes and only complete lines are decoded, which lets us know byte offset
+    of every line. That is safe only for ascii compatible encodings (utf-8, latin-1, cp125x, shift_jis, ...),
+    other encodings (utf-16, utf-32) are refused. Lines longer than max_line are split on character boundary.
+    """
+    _ASCII = ''.join(chr(code) for code in range(128))
+    _BOUNDARY_WINDOW = 64           # bytes searched for character boundary when splitting long line
+
+    def __init__(self, encoding=None, errors='replace', max_line=None, start=0):
+        """
+        :param str encoding:            decode lines to unicode, None means lines are byte strings
+        :param str errors:              decoding error handling
+        :param int max_line:            longer lines are split, default CONSOLE_MAX_LINE
+        :param int start:               stream offset of the first chunk
+        """
+        if encoding and self._ASCII.decode(encoding, 'replace') != self._ASCII.decode('ascii'):
+            raise ValueError('Console can be split to lines only in ascii compatible encoding, not %s' % encoding)
+        self._encoding = encoding
+        self._utf8 = bool(encoding) and codecs.lookup(encoding).name == 'utf-8'
+        self._errors = errors
+        self._max_line = jenkinsapi.misc.default(max_line, CONSOLE_MAX_LINE)
+        self._pending = []              # pieces of unfinished line
+        self._pending_size = 0
+        self._position = start          # stream offset behind the last complete line
+        self._ends = []
+
+    @property
+    def position(self):
+        """
+        :return int:            stream offset behind the last line returned
+        """
+        return self._position
+
+    @property
+    def ends(self):
+        """
+        :return list:           stream offsets behind each line returned by the last feed or flush
+        """
+        return self._ends
+
+    def _line(self, line):
+        if line.endswith('\r'):
+            line = line[:-1]
+        return line.decode(self._encoding, self._errors) if self._encoding else line
+
+    def _boundary(self, data):
+        """
+        :param str data:        beginning of too long line
+        :return int:            length of data prefix which ends on character boundary
+        """
+        size = len(data)
+        if not self._encoding:
+            return size
+        if self._utf8:
+            # lead byte of the last character, continuation bytes are 10xxxxxx
+            lead = size - 1
+            while lead > max(0, size - 4) and 0x80 <= ord(data[lead]) < 0xc0:
+                lead -= 1
+            code = ord(data[lead])
+            length = 2 if 0xc0 <= code < 0xe0 else 3 if 0xe0 <= code < 0xf0 else 4 if 0xf0 <= code < 0xf8 else 1
+            return size if size - lead >= length else lead
+        # bytes below 0x40 are never part of multibyte character in ascii compatible encodings
+        for position in xrange(size - 1, max(-1, size - 1 - self._BOUNDARY_WINDOW), -1):
+            if data[position] < '\x40':
+                return position + 1
+        return size
+
+    def feed(self, chunk):
+        """
+        :param str chunk:       next bytes of the stream
+        :return list:           lines completed by the chunk (without line terminators)
+        """
+        lines = chunk.split('\n')
+        self._ends = []
+        if len(lines) > 1:
+            lines[0] = ''.join(self._pending) + lines[0]
+            last = lines.pop()
+            for line in lines:
+                self._position += len(line) + 1
+                self._ends.append(self._position)
+            self._pending, self._pending_size = [last], len(last)
+            lines = [self._line(line) for line in lines]
+        else:
+            self._pending.append(chunk)
+            self._pending_size += len(chunk)
+            lines = []
+        if self._pending_size > self._max_line:
+            pending = ''.join(self._pending)
+            cut = self._boundary(pending) or len(pending)
+            lines.append(self._line(pending[:cut]))
+            self._position += cut
+            self._ends.append(self._position)
+            self._pending = [pending[cut:]] if cut < len(pending) else []
+            self._pending_size = len(pending) - cut
+        return lines
+
+    def flush(self):
+        """
+        :return list:           unfinished last line of the stream, if there is any
+        """
+        line = ''.join(self._pending)
+        self._position += self._pending_size
+        self._ends = [self._position] if line else []
+        self._pending, self._pending_size = [], 0
+        return [self._line(line)] if line else []
+
+
+class PatternSet(object):
+    """
+    Many patterns matched by a single pass over a line
+
+    Patterns with the same flags are combined into one alternation of named groups, so matching 10+ patterns
+    costs one regex search. Patterns with backreferences (or which cannot be combined) are searched separately.
+    When several patterns match a line, the leftmost match wins. Returned match object comes from the pattern
+    itself, so its groups are numbered as usual.
+    """
+    _BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+    def __init__(self, patterns):
+        """
+        :param patterns:            dict {name: pattern} or list of patterns (names are pattern strings),
+                                    pattern is either string or compiled regex
+        """
+        if isinstance(patterns, dict):
+            items = patterns.items()
+        else:
+            items = [(getattr(pattern, 'pattern', pattern), pattern) for pattern in patterns]
+        self._names = {}                    # group name -> (pattern name, compiled pattern)
+        self._regexes = []                  # [(regex, pattern name or None for combined regex)]
+        combined = {}                       # {flags: [(group, compiled pattern)]}
+        used = {}                           # {flags: group names used by combined patterns}
+        for i, (name, pattern) in enumerate(items):
+            if isinstance(pattern, basestring):
+                pattern = re.compile(pattern)
+            names = set(pattern.groupindex)
+            if self._BACKREFERENCE.search(pattern.pattern) or pattern.groups + 1 > PATTERN_MAX_GROUPS \
+                    or names & used.setdefault(pattern.flags, set()):
+                self._regexes.append((pattern, name))
+                continue
+            used[pattern.flags] |= names
+            group = '_p%d' % i
+            self._names[group] = (name, pattern)
+            combined.setdefault(pattern.flags, []).append((group, pattern))
+        for flags, alternatives in combined.iteritems():
+            batch, groups = [], 0
+            for group, pattern in alternatives:
+                if groups + pattern.groups + 1 > PATTERN_MAX_GROUPS:
+                    self._combine(flags, batch)
+                    batch, groups = [], 0
+                batch.append((group, pattern))
+                groups += pattern.groups + 1
+            self._combine(flags, batch)
+
+    def _combine(self, flags, batch):
+        if not batch:
+            return
+        try:
+            regex = re.compile('|'.join('(?P<%s>%s)' % (group, pattern.pattern) for group, pattern in batch), flags)
+        except re.error:
+            # lets search them separately
+            for group, pattern in batch:
+                self._regexes.append((pattern, self._names[group][0]))
+            return
+        self._regexes.append((regex, None))
+
+    def __len__(self):
+        return len(self._regexes)
+
+    def search(self, line):
+        """
+        :param line:                line to be scanned
+        :return tuple:              (pattern name, match object) of the leftmost match or None
+        """
+        best = None
+        for regex, name in self._regexes:
+            match = regex.search(line)
+            if match is not None and (best is None or match.start() < best[1].start()):
+                if name is None:
+                    # which alternative has matched, and its own match (only matches pay for this)
+                    name, pattern = self._names[match.lastgroup]
+                    match = pattern.match(line, match.start()) or match
+                best = (name, match)
+        return best
+
+
+class OffsetCheckpoint(object):
+    """
+    Console offset persisted in a small json file, so an interrupted reader can resume
+
+    File is replaced atomically, so it always contains either old or new offset.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path:            checkpoint file
+        """
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self, url):
+        """
+        :param str url:             console url, checkpoint of different console is ignored
+        :return dict:               stored checkpoint (offset and extra values) or None
+        """
+        try:
+            with open(self._path, 'rb') as f:
+                checkpoint = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(checkpoint, dict) or checkpoint.get('url') != url:
+            logger.warning(' Ignoring checkpoint %s, it does not belong to %s' % (self._path, url))
+            return None
+        return checkpoint
+
+    def save(self, url, offset, **extra):
+        """
+        :param str url:             console url
+        :param int offset:          offset to resume from
+        :param extra:               other values stored with the offset
+        """
+        tmp = '%s.tmp' % self._path
+        with open(tmp, 'wb') as f:
+            json.dump(dict(extra, url=url, offset=offset), f)
+        if os.name == 'nt' and os.path.exists(self._path):
+            # rename does not replace existing file on windows
+            os.remove(self._path)
+        os.rename(tmp, self._path)
+
+    def remove(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+
+def compressor(compress, level=None):
+    """
+    :param str compress:        None, 'gzip' or 'zstd' (needs zstandard package)
+    :param int level:           compression level, None means default of the algorithm
+    :return:                    compressor object with compress(data) and flush() (flush ends gzip member
+                                or zstd frame), None if compress is None
+    """
+    if compress is None:
+        return None
+    if compress == 'gzip':
+        return zlib.compressobj(jenkinsapi.misc.default(level, 6), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compress == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstd compression requires zstandard package')
+        return zstandard.ZstdCompressor(level=jenkinsapi.misc.default(level, 3)).compressobj()
+    raise ValueError('Unsupported compression %s' % compress)
+
+
+class ConsoleSink(object):
+    """
+    Streams raw console bytes to a file, optionally compressed
+
+    When the target is a file name, a sidecar checkpoint (target + '.offset') records console offset
+    and file size at each checkpoint. Compressed output ends gzip member (zstd frame) at every checkpoint,
+    so interrupted download is resumed by truncating the file to the last checkpoint and appending
+    a new member - concatenated members are valid gzip (zstd) stream.
+
+    Uncompressed file can be indexed while downloading (see jenkinsapi.consoleindex.LineIndex).
+
+    Usage:
+        stats = ConsoleSink(build.console_reader(), 'console.log.gz', compress='gzip').run()
+    """
+
+    def __init__(self, reader, target, compress=None, level=None, resume=True, index=False):
+        """
+        :param ConsoleReader reader:    console reader (its start offset is overridden by checkpoint)
+        :param target:                  file name or file-like object opened for binary writing
+        :param str compress:            None, 'gzip' or 'zstd'
+        :param int level:               compression level
+        :param bool resume:             continue interrupted download of target file
+        :param bool index:              build line index (target + '.idx') of uncompressed target file
+        """
+        self._reader = reader
+        self._target = target
+        self._compress = compress
+        self._level = level
+        self._checkpoint = None
+        self._index = None
+        if index:
+            if compress is not None or not isinstance(target, basestring):
+                raise ValueError('Line index can be built only for uncompressed file')
+            self._index = jenkinsapi.consoleindex.LineIndex(target)
+        if isinstance(target, basestring):
+            self._checkpoint = OffsetCheckpoint('%s.offset' % target)
+            if not resume:
+                self._checkpoint.remove()
+        self._stats = {'bytes': 0, 'written': 0, 'checkpoints': 0, 'seconds': 0.0, 'resumed': None}
+
+    def stats(self):
+        """
+        :return dict:       bytes (console bytes), written (file bytes), checkpoints, seconds, resumed
+                            (console offset we resumed from or None), throughput (console bytes per second),
+                            ratio (written / bytes) and reader's stats
+        """
+        stats = dict(self._stats)
+        stats['throughput'] = stats['bytes'] / stats['seconds'] if stats['seconds'] else None
+        stats['ratio'] = float(stats['written']) / stats['bytes'] if stats['bytes'] else None
+        stats['reader'] = self._reader.stats()
+        return stats
+
+    @property
+    def index(self):
+        """
+        :return LineIndex:  line index of target or None
+        """
+        return self._index
+
+    def _open(self):
+        """
+        :return file:       output file positioned where we continue writing
+        """
+        if self._checkpoint is None:
+            return self._target
+        checkpoint = self._checkpoint.load(self._reader._url)
+        if checkpoint is not None and checkpoint.get('compress') == self._compress \
+                and os.path.exists(self._target):
+            output = open(self._target, 'r+b')
+            output.truncate(checkpoint['position'])
+            output.seek(checkpoint['position'])
+            self._reader.seek(checkpoint['offset'])
+            self._stats['resumed'] = checkpoint['offset']
+            if self._index is not None:
+                self._index.truncate(checkpoint['position'])
+            logger.info(' Resuming console %s to %s from offset %d' % (self._reader._url, self._target,
+                                                                      checkpoint['offset']))
+            return output
+        if self._index is not None:
+            self._index.truncate(0)
+        return open(self._target, 'wb')
+
+    def _save(self, output, offset):
+        if self._checkpoint is None:
+            output.flush()
+            return
+        output.flush()
+        os.fsync(output.fileno())
+        if self._index is not None:
+            self._index.save()
+        self._checkpoint.save(self._reader._url, offset, position=output.tell(), compress=self._compress)
+        self._stats['checkpoints'] += 1
+
+    def run(self):
+        """
+        Download console (following it until the build finishes)
+        :return dict:       stats
+        """
+        start = time()
+        encoder = compressor(self._compress, self._level)
+        output = self._open()
+        try:
+            pending = 0                 # console bytes since last checkpoint
+            checkpointed = start
+            for chunk in self._reader.iter_chunks(checkpoint=False):
+                if chunk is not None:
+                    self._stats['bytes'] += len(chunk)
+                    pending += len(chunk)
+                    data = encoder.compress(chunk) if encoder is not None else chunk
+                    output.write(data)
+                    self._stats['written'] += len(data)
+                    if self._index is not None:
+                        self._index.feed(chunk)
+                now = time()
+                if pending and (pending >= SINK_CHECKPOINT_BYTES or now - checkpointed >= SINK_CHECKPOINT_INTERVAL):
+                    if encoder is not None:
+                        # finish member (frame), next one starts with fresh compressor
+                        data = encoder.flush()
+                        output.write(data)
+                        self._stats['written'] += len(data)
+                        encoder = compressor(self._compress, self._level)
+                    self._save(output, self._reader.offset)
+                    pending, checkpointed = 0, now
+            if encoder is not None:
+                data = encoder.flush()
+                output.write(data)
+                self._stats['written'] += len(data)
+            self._save(output, self._reader.offset)
+        finally:
+            if output is not self._target:
+                output.close()
+            self._stats['seconds'] += time() - start
+        return self.stats()
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting rate of requests shared by many threads
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param float rate:          requests per second
+        :param float burst:         max tokens accumulated while idle, default is rate (at least 1)
+        """
+        assert rate > 0, 'Invalid rate (%s)' % rate
+        self._rate = float(rate)
+        self._burst = float(jenkinsapi.misc.default(burst, max(1.0, rate)))
+        self._tokens = self._burst
+        self._stamp = time()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop=None):
+        """
+        Block until a request is allowed
+        :param threading.Event stop:    stop waiting when set
+        :return bool:                   True if token has been acquired
+        """
+        while stop is None or not stop.is_set():
+            with self._lock:
+                now = time()
+                self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self._rate
+            if stop is not None:
+                stop.wait(wait)
+            else:
+                sleep(wait)
+        return False
+
+
+class _Followed(object):
+    """
+    State of one build followed by ConsoleMultiplexer
+    """
+    __slots__ = ('build', 'reader', 'splitter', 'wait', 'seq')
+
+    def __init__(self, build, reader, splitter, wait, seq):
+        self.build = build
+        self.reader = reader
+        self.splitter = splitter
+        self.wait = wait
+        self.seq = seq
+
+
+class ConsoleMultiplexer(object):
+    """
+    Follows consoles of many builds by a small pool of workers and merges their lines into one stream
+
+    Builds which produced output in their last request are read again first, idle builds are polled
+    with exponential backoff (see ConsoleReader). Requests of all workers are capped by a global rate.
+
+    Usage:
+        mux = ConsoleMultiplexer(builds, workers=8, rate=20)
+        for build, line in mux:
+            print '%s: %s' % (build.number, line)
+    """
+
+    def __init__(self, builds=None, workers=None, rate=None, poll_interval=1, ceiling=None, encoding=None,
+                 errors='replace', buffer=None):
+        """
+        :param builds:              builds to be followed (more can be added by add)
+        :param int workers:         number of threads issuing requests, default MULTIPLEX_WORKERS
+        :param float rate:          max requests per second of all workers together, None means unlimited
+        :param poll_interval:       first wait of idle build's backoff
+        :param ceiling:             longest wait of idle build, default CONSOLE_POLL_CEILING
+        :param str encoding:        decode lines to unicode, None means lines are byte strings
+        :param str errors:          decoding error handling
+        :param int buffer:          max lines waiting for consumer, default MULTIPLEX_BUFFER
+        """
+        assert poll_interval > 0, 'Insanely short poll_interval (%s)' % poll_interval
+        self._workers = jenkinsapi.misc.default(workers, MULTIPLEX_WORKERS)
+        self._limiter = RateLimiter(rate) if rate is not None else None
+        self._poll_interval = poll_interval
+        self._ceiling = max(jenkinsapi.misc.default(ceiling, CONSOLE_POLL_CEILING), poll_interval)
+        self._encoding = encoding
+        self._errors = errors
+        self._lines = Queue(maxsize=jenkinsapi.misc.default(buffer, MULTIPLEX_BUFFER))
+        self._cond = threading.Condition()
+        self._active = deque()              # builds producing output, read them as soon as possible
+        self._idle = []                     # heap of (due time, seq, followed) of idle builds
+        self._followed = 0                  # builds not finished yet (including those being read)
+        self._picks = 0
+        self._seq = 0
+        self._errors_by_build = {}
+        self._stop = threading.Event()
+        self._threads = []
+        for build in builds or []:
+            self.add(build)
+
+    def add(self, build, start=None):
+        """
+        :param JenkinsBuild build:  build to be followed
+        :param int start:           byte offset to start from, None means continue from build's last position
+        :return:                    self
+        """
+        reader = ConsoleReader(build, start=start, poll_interval=0, encoding=None)
+        if not reader.more:
+            return self
+        splitter = LineSplitter(encoding=self._encoding, errors=self._errors, start=reader.offset)
+        wait = jenkinsapi.misc.AdaptiveWait(floor=self._poll_interval, ceiling=self._ceiling,
+                                            factor=CONSOLE_POLL_FACTOR)
+        with self._cond:
+            self._seq += 1
+            self._followed += 1
+            self._active.append(_Followed(build, reader, splitter, wait, self._seq))
+            self._cond.notify()
+        return self
+
+    @property
+    def errors(self):
+        """
+        :return dict:               {build: exception} of builds which could not be followed
+        """
+        return dict(self._errors_by_build)
+
+    def stats(self):
+        """
+        :return dict:               followed (unfinished builds), active, idle and buffered (lines) counts
+        """
+        with self._cond:
+            return {'followed': self._followed, 'active': len(self._active), 'idle': len(self._idle),
+                    'buffered': self._lines.qsize()}
+
+    def start(self):
+        if not self._threads:
+            self._stop.clear()
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._run, name='jenkinsapi-console-%d' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        return self
+
+    def __iter__(self):
+        """
+        yield (build, line) until all followed builds finish
+        """
+        self.start()
+        try:
+            while True:
+                try:
+                    yield self._lines.get(timeout=0.1)
+                except Empty:
+                    with self._cond:
+                        if self._followed == 0 and self._lines.empty():
+                            break
+        finally:
+            self.stop()
+
+    def _pick(self):
+        """
+        :return _Followed:          next build to be read, None if we are stopping
+        """
+        with self._cond:
+            while not self._stop.is_set():
+                now = time()
+                idle_due = self._idle and self._idle[0][0] <= now
+                self._picks += 1
+                if self._active and not (idle_due and self._picks % MULTIPLEX_FAIRNESS == 0):
+                    return self._active.popleft()
+                if idle_due:
+                    return heapq.heappop(self._idle)[2]
+                self._cond.wait(self._idle[0][0] - now if self._idle else None if self._followed else 0.1)
+        return None
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._lines.put(item, timeout=0.1)
+                return True
+            except Full:
+                # consumer is slower than builds, wait for it
+                pass
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            followed = self._pick()
+            if followed is None:
+                break
+            if self._limiter is not None and not self._limiter.acquire(self._stop):
+                break
+            offset = followed.reader.offset
+            # noinspection PyBroadException
+            try:
+                for chunk in followed.reader.fetch():
+                    for line in followed.splitter.feed(chunk):
+                        if not self._put((followed.build, line)):
+                            return
+                if not followed.reader.more:
+                    for line in followed.splitter.flush():
+                        self._put((followed.build, line))
+            except Exception as e:
+                logger.exception(' Cannot follow console of %r' % followed.build)
+                self._errors_by_build[followed.build] = e
+                finished = True
+            else:
+                finished = not followed.reader.more
+            with self._cond:
+                if finished:
+                    self._followed -= 1
+                elif followed.reader.offset != offset:
+                    followed.wait.reset()
+                    self._active.append(followed)
+                else:
+                    heapq.heappush(self._idle, (time() + followed.wait.next(), followed.seq, followed))
+                self._cond.notify()
@@ -0,0 +1,268 @@
+import calendar
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+import jenkinsapi.misc
+
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = 'sedlacek'
+
+INDEX_MAGIC = 'JLIX'
+INDEX_SCAN_CHUNK = 1048576          # bytes read at once when indexing log file
+
+# 8 byte offsets, so logs over 4GB work on platforms with 32 bit long as well
+_TYPECODE = 'L' if array('L').itemsize == 8 else 'd'
+_HEADER = struct.Struct('<4sc3xQ')  # magic, typecode, bytes of log covered by index
+
+# e.g. [2016-03-01T12:34:56.789Z] or 2016-03-01 12:34:56 (timestamper plugin, log4j, ...)
+_TIMESTAMP = re.compile(r'^\[?(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})')
+
+
+def iso_timestamp(line):
+    """
+    Default timestamp parser, ISO date and time at the beginning of the line (taken as UTC)
+
+    :param str line:        log line
+    :return float:          epoch or None if line has no timestamp
+    """
+    match = _TIMESTAMP.match(line)
+    if match is None:
+        return None
+    try:
+        return float(calendar.timegm(time.strptime('%s %s' % match.groups(), '%Y-%m-%d %H:%M:%S')))
+    except ValueError:
+        return None
+
+
+class LineIndex(object):
+    """
+    Persistent index of line offsets of a console log on disk
+
+    Index (log + '.idx') keeps offsets of all newlines, lines are read through mmap of the log,
+    so "line N +- 50" or "lines between two timestamps" do not rescan the log. Index is either built
+    while the log is streamed (feed, see ConsoleSink) or by scanning the file (update), which indexes
+    only the part of the log not covered yet.
+
+    Usage:
+        index = LineIndex('console.log').update()
+        index.around(123456, context=50)
+        index.between(start_epoch, end_epoch)
+    """
+
+    def __init__(self, path, index_path=None, timestamp=None):
+        """
+        :param str path:            log file
+        :param str index_path:      index file, default is path + '.idx'
+        :param timestamp:           callable(line) -> epoch or None, default iso_timestamp
+        """
+        self._path = path
+        self._index_path = jenkinsapi.misc.default(index_path, '%s.idx' % path)
+        self._timestamp = jenkinsapi.misc.default(timestamp, iso_timestamp)
+        self._ends = array(_TYPECODE)       # offsets of newlines
+        self._covered = 0                   # bytes of log covered by index
+        self._saved = 0                     # newlines already written to index file
+        self._file = None
+        self._map = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'rb') as f:
+                magic, typecode, covered = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != INDEX_MAGIC or typecode != _TYPECODE:
+                    raise ValueError('Unknown index format')
+                self._ends.fromstring(f.read())
+        except (IOError, OSError, struct.error, ValueError) as e:
+            if os.path.exists(self._index_path):
+                logger.warning(' Ignoring index %s: %s' % (self._index_path, e))
+            self._ends = array(_TYPECODE)
+            self._covered = self._saved = 0
+            return
+        # offsets are written before the header, so interrupted save might leave offsets not covered by it
+        count = len(self._ends)
+        while count > 0 and self._ends[count - 1] >= covered:
+            count -= 1
+        del self._ends[count:]
+        self._covered = covered
+        self._saved = count
+        if os.path.exists(self._path) and os.path.getsize(self._path) < covered:
+            # log has been truncated or replaced
+            self.truncate(os.path.getsize(self._path))
+
+    @property
+    def covered(self):
+        """
+        :return int:        bytes of log covered by index
+        """
+        return self._covered
+
+    def feed(self, chunk):
+        """
+        Index next chunk of log (the chunk is written to the log by caller)
+        :param str chunk:   bytes appended to the log
+        """
+        base = self._covered
+        position = chunk.find('\n')
+        while position != -1:
+            self._ends.append(base + position)
+            position = chunk.find('\n', position + 1)
+        self._covered += len(chunk)
+
+    def truncate(self, size):
+        """
+        Forget everything behind size bytes of log (e.g. when resuming interrupted download)
+        """
+        count = len(self._ends)
+        while count > 0 and self._ends[count - 1] >= size:
+            count -= 1
+        del self._ends[count:]
+        self._covered = min(self._covered, size)
+        self._saved = min(self._saved, count)
+        self.save(rewrite=True)
+        return self
+
+    def update(self):
+        """
+        Index part of the log file which is not covered yet
+        :return:            self
+        """
+        with open(self._path, 'rb') as f:
+            f.seek(self._covered)
+            while True:
+                chunk = f.read(INDEX_SCAN_CHUNK)
+                if not chunk:
+                    break
+                self.feed(chunk)
+        return self.save()
+
+    def save(self, rewrite=False):
+        """
+        Write newly indexed offsets to index file
+        :param bool rewrite:    rewrite whole index file
+        :return:                self
+        """
+        if rewrite or not os.path.exists(self._index_path):
+            self._saved = 0
+            mode = 'wb'
+        else:
+            mode = 'r+b'
+        with open(self._index_path, mode) as f:
+            f.seek(_HEADER.size + self._saved * self._ends.itemsize)
+            self._ends[self._saved:].tofile(f)
+            f.truncate()
+            # header goes last, so it never covers offsets which are not written yet
+            f.seek(0)
+            f.write(_HEADER.pack(INDEX_MAGIC, _TYPECODE, self._covered))
+        self._saved = len(self._ends)
+        return self
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _data(self):
+        """
+        :return mmap:       log mapped to memory (remapped when it has grown), None for empty log
+        """
+        size = min(self._covered, os.path.getsize(self._path))
+        if self._map is not None and len(self._map) >= size:
+            return self._map
+        self.close()
+        if size == 0:
+            return None
+        self._file = open(self._path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def __len__(self):
+        """
+        :return int:        number of lines (including unterminated last line)
+        """
+        last = self._ends[-1] + 1 if self._ends else 0
+        return len(self._ends) + (1 if self._covered > last else 0)
+
+    def offset(self, number):
+        """
+        :param int number:  line number (0 based)
+        :return int:        log offset of the line
+        """
+        if number < 0 or number >= len(self):
+            raise IndexError('Line %d out of range' % number)
+        return int(self._ends[number - 1]) + 1 if number > 0 else 0
+
+    def line(self, number):
+        """
+        :param int number:  line number (0 based)
+        :return str:        line without line terminator
+        """
+        start = self.offset(number)
+        end = int(self._ends[number]) if number < len(self._ends) else self._covered
+        line = self._data()[int(start):end]
+        return line[:-1] if line.endswith('\r') else line
+
+    def __getitem__(self, number):
+        return self.line(number)
+
+    def lines(self, first, last):
+        """
+        :param int first:   first line number
+        :param int last:    line number behind the last line
+        :return list:       lines [first, last)
+        """
+        return [self.line(number) for number in xrange(max(0, first), min(last, len(self)))]
+
+    def around(self, number, context=50):
+        """
+        :return list:       line number with context lines before and after it
+        """
+        return self.lines(number - context, number + context + 1)
+
+    def _line_time(self, number, limit):
+        """
+        :return tuple:      (line number, timestamp) of the first timestamped line in [number, limit),
+                            (None, None) if there is none
+        """
+        for probe in xrange(number, limit):
+            stamp = self._timestamp(self.line(probe))
+            if stamp is not None:
+                return probe, stamp
+        return None, None
+
+    def find_time(self, epoch):
+        """
+        Binary search for the first timestamped line not older than epoch
+        (lines are expected to be in chronological order, lines without timestamp are skipped)
+
+        :param float epoch:     time
+        :return int:            line number, len(self) if there is no such line
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            number, stamp = self._line_time(middle, high)
+            if number is None:
+                # no timestamp in [middle, high), so search the lower half
+                high = middle
+            elif stamp < epoch:
+                low = number + 1
+            else:
+                high = middle
+        number, stamp = self._line_time(low, len(self))
+        return number if number is not None else len(self)
+
+    def between(self, first, last):
+        """
+        :param float first:     epoch
+        :param float last:      epoch
+        :return list:           lines logged in [first, last) (including untimestamped lines among them)
+        """
+        return self.lines(self.find_time(first), self.find_time(last))
@@ -0,0 +1,151 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+__author__ = 'sedlacek'
+
+
+class IdentityMap(object):
+    """
+    Registry of API objects keyed by objid (e.g. Jenkins._jobs, JenkinsJob._builds, JenkinsQueue._items)
+
+    All objects are referenced weakly, so lookups return the same instance as long as anybody holds it.
+    Recently used objects are kept alive by LRU bounded by maxsize and maxage, pinned objects
+    (e.g. running builds) are never evicted from it. Without limits the map holds all objects strongly.
+    """
+
+    _EXPIRE_TICKS = 10                          # expired objects are released maxage / _EXPIRE_TICKS apart
+
+    def __init__(self, maxsize=None, maxage=None, pin=None):
+        """
+        :param int maxsize:         max objects kept alive by the map, None means unlimited
+        :param float maxage:        seconds since last use after which object is no more kept alive, None means forever
+        :param pin:                 callable(obj) -> bool, True if object must be kept alive regardless of limits
+        """
+        self._maxsize = maxsize
+        self._maxage = maxage
+        self._pin = pin
+        self._weak = weakref.WeakValueDictionary()
+        self._strong = OrderedDict()            # {key: [obj, last use]}, least recently used first
+        self._next_expiry = 0                   # time of next release of expired objects
+        self._lock = threading.RLock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def _touch(self, key, obj, now):
+        """
+        Mark object as recently used (and keep it alive)
+        """
+        self._strong.pop(key, None)
+        self._strong[key] = [obj, now]
+
+    def _evict(self, now):
+        """
+        Release expired and least recently used objects (they stay in the map while they are alive)
+        """
+        if self._maxage is not None and now >= self._next_expiry:
+            # walk from the least recently used, pinned objects are touched, so we stop at them at latest
+            self._next_expiry = now + float(self._maxage) / self._EXPIRE_TICKS
+            while self._strong:
+                key = next(iter(self._strong))
+                obj, used = self._strong[key]
+                if now - used < self._maxage:
+                    break
+                if self._pin is not None and self._pin(obj):
+                    self._touch(key, obj, now)
+                    continue
+                del self._strong[key]
+                self._stats['expirations'] += 1
+        if self._maxsize is not None:
+            candidates = len(self._strong)
+            while len(self._strong) > self._maxsize and candidates > 0:
+                candidates -= 1
+                key, (obj, used) = self._strong.popitem(last=False)
+                if self._pin is not None and self._pin(obj):
+                    # pinned objects go to the end of LRU
+                    self._strong[key] = [obj, used]
+                    continue
+                self._stats['evictions'] += 1
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                obj = self._weak[key]
+            except KeyError:
+                self._stats['misses'] += 1
+                raise
+            self._stats['hits'] += 1
+            now = time.time()
+            self._touch(key, obj, now)
+            self._evict(now)
+            return obj
+
+    def __setitem__(self, key, obj):
+        with self._lock:
+            now = time.time()
+            self._weak[key] = obj
+            self._touch(key, obj, now)
+            self._evict(now)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._strong.pop(key, None)
+            del self._weak[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._weak
+
+    def __len__(self):
+        with self._lock:
+            return len(self._weak)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def pop(self, key, *default):
+        with self._lock:
+            self._strong.pop(key, None)
+            return self._weak.pop(key, *default)
+
+    def setdefault(self, key, obj):
+        with self._lock:
+            try:
+                return self[key]
+            except KeyError:
+                self[key] = obj
+                return obj
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        with self._lock:
+            return self._weak.keys()
+
+    def items(self):
+        with self._lock:
+            return self._weak.items()
+
+    def values(self):
+        with self._lock:
+            return self._weak.values()
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def stats(self):
+        """
+        :return dict:       hits, misses, evictions (LRU size limit), expirations (age limit),
+                            size (alive objects) and kept (objects kept alive by the map)
+        """
+        with self._lock:
+            self._next_expiry = 0
+            self._evict(time.time())
+            return dict(self._stats, size=len(self._weak), kept=len(self._strong))
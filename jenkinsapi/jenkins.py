@@ -2,6 +2,9 @@ import jenkinsapi.jenkinsbase
 import jenkinsapi.jenkinsqueue
 import jenkinsapi.requester
 import jenkinsapi.jenkinsjob
+import jenkinsapi.identitymap
+import jenkinsapi.misc
+import jenkinsapi.reconcile
 
 __author__ = 'sedlacek'
 
@@ -13,6 +16,9 @@ class Jenkins(jenkinsapi.jenkinsbase.JenkinsBase):
     It is as well container for keeping all the objects only once
     """
 
+    # jobs with their last build status in one request, jobs and builds are hydrated from it
+    _TREE = 'jobs[name,url,color,lastBuild[number,url,result,building,timestamp,duration,estimatedDuration]]'
+
     def __init__(self, url=None, data=None, poll_interval=None, auth=jenkinsapi.requester.JenkinsAuth(), timeout=None):
         """
         :param parent:              parent object
@@ -22,6 +28,11 @@ class Jenkins(jenkinsapi.jenkinsbase.JenkinsBase):
         :param poll_interval:       api poll interval
         :param auth:                authentication object
         """
+        # registries must exist before the first poll
+        self._jobs = jenkinsapi.identitymap.IdentityMap(maxsize=jenkinsapi.misc.JOBS_CACHE_SIZE,
+                                                        maxage=jenkinsapi.misc.JOBS_CACHE_AGE)
+        self._views = {}
+        self._reconciler = jenkinsapi.reconcile.Reconciler(key=lambda job: job['name'])
         super(Jenkins, self).__init__(url=url,
                                       data=data,
                                       poll_interval=poll_interval,
@@ -32,8 +43,6 @@ class Jenkins(jenkinsapi.jenkinsbase.JenkinsBase):
         self.objid = None
         self._queue = jenkinsapi.jenkinsqueue.JenkinsQueue(parent=self, objid='queue', timeout=timeout,
                                                            poll_interval=poll_interval, auth=auth)
-        self._jobs = {}
-        self._views = {}
 
 
     @property
@@ -47,12 +56,49 @@ class Jenkins(jenkinsapi.jenkinsbase.JenkinsBase):
     @property
     def jobs(self):
         self.auto_poll()
-        return self._jobs
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            return dict(self._jobs)
+
+    def job_cache_stats(self):
+        """
+        :return dict:       statistics of job registry, see IdentityMap.stats
+        """
+        return self._jobs.stats()
+
+    def on_jobs_change(self, callback):
+        """
+        Register callback called after each poll which added, removed or changed any job
+        :param callback:    callable(jenkinsapi.reconcile.ChangeSet), keys are job names
+        :return:            callback
+        """
+        return self._reconciler.subscribe(callback)
+
+    def remove_jobs_change(self, callback):
+        self._reconciler.unsubscribe(callback)
 
     @property
     def views(self):
         return self._views
 
+    def _poll(self, tree=None):
+        super(Jenkins, self)._poll(tree=tree)
+        # jobs might have been registered since the last poll, even if our payload has not changed
+        return self._prune()
+
+    def _prune(self):
+        """
+        Delete all jobs which are no longer in jenkins, registry might contain jobs we have never seen
+        in our payload (e.g. created by objid), so registry is compared with the last payload
+        :return:            self
+        """
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            for key in set(self._jobs.keys()) - set(self._reconciler.snapshot):
+                self.delete_job_ref(key)
+        return self
+
+    def _in_payload(self, child):
+        return isinstance(child, jenkinsapi.jenkinsjob.JenkinsJob) and child.objid in self._reconciler
+
     def update_job_ref(self, otherjob):
         """
         Updating job reference
@@ -60,18 +106,16 @@ class Jenkins(jenkinsapi.jenkinsbase.JenkinsBase):
         :param otherjob:        JenkinsJob instance
         :return:                updated job
         """
-        try:
-            myjob = self._jobs[otherjob.objid]
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            myjob = self._jobs.setdefault(otherjob.objid, otherjob)
 
-            # we want to compare objects only if they are not the same
-            if myjob != otherjob and myjob < otherjob:
-                myjob.__an_update__(auth=otherjob.auth, poll_interval=otherjob.poll_interval, timeout=otherjob.timeout)
-                # now merge the data
-                myjob.poll(data=otherjob.data, now=otherjob.last_poll)
-        except KeyError:
-            self._jobs[otherjob.objid] = otherjob
+        # we want to compare objects only if they are not the same
+        if myjob != otherjob and myjob < otherjob:
+            myjob.__an_update__(auth=otherjob.auth, poll_interval=otherjob.poll_interval, timeout=otherjob.timeout)
+            # now merge the data (poll takes object's own lock)
+            myjob.poll(data=otherjob._data, now=otherjob.last_poll)
 
-        return self._jobs[otherjob.objid]
+        return myjob
 
     def delete_job_ref(self, job):
         """
@@ -86,28 +130,33 @@ class Jenkins(jenkinsapi.jenkinsbase.JenkinsBase):
             jobid = job
 
         # delete from job list
-        try:
-            del self._jobs[jobid]
-        except KeyError:
-            # something else might have deleted it already
-            pass
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            try:
+                del self._jobs[jobid]
+            except KeyError:
+                # something else might have deleted it already
+                pass
         return self
 
     def _update_data(self, data, now=None):
         """
         We need to create job structure and as well view structure
+
+        Jobs are created as stubs seeded from our payload, they fetch their own data
+        only when a property needs data they do not have.
         :param now:
         """
         self._data = data
-        # store all the item keys
-        keystoremove = self._jobs.keys()
-        for job in data['jobs']:
-            if job['name'] in keystoremove:
-                # we do not want to remove this one
-                keystoremove.remove(job['name'])
+        changes = self._reconciler.reconcile(data.get('jobs', []))
+        self._prune()
+        # jobs are created and updated outside of registry lock, as poll takes job's own lock
+        for job in data.get('jobs', []):
+            myjob = self._jobs.get(job['name'])
+            if myjob is not None:
+                myjob.poll(data=job, now=now)
             else:
-                jenkinsapi.jenkinsjob.JenkinsJob(parent=self, objid=job['name'], poll_interval=self.poll_interval,
+                # new job or job released by registry (get-or-create is atomic in JenkinsJob metaclass)
+                jenkinsapi.jenkinsjob.JenkinsJob(parent=self, objid=job['name'], data=job,
+                                                 poll_interval=self.poll_interval,
                                                  auth=self.auth, timeout=self.timeout)
-        # and now delete all jobs which are no longer in jenkins
-        for key in keystoremove:
-            self.delete_job_ref(key)
+        self._reconciler.notify(changes)
@@ -54,6 +54,7 @@ class Artifact(object):
                 password=self.parent.auth.auth.password,
                 timeout=self.parent.timeout,
                 session=session,
+                owner=self.__class__.__name__,
             )
         return self._requester
 
@@ -109,11 +110,11 @@ class JenkinsArtifacts(jenkinsapi.jenkinsbase.JenkinsBase):
         """
         :param parent:              parent jenkins object
         :param objid:               object id in parent context (artifact relative path)
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param data:                we already got the data, so initiate the object with the data
         :param auth:                jenkins auth - either apitoken or username and pwd
         :param timeout:             timeout for API calls
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param poll_interval:       0 - data polled al  ways when value requested
                                     >0 - interval in which data are refreshed (in seconds)
                                     None - data automatically polled only once, when data are accessed
@@ -182,10 +183,11 @@ class JenkinsArtifacts(jenkinsapi.jenkinsbase.JenkinsBase):
         self.auto_poll()
         return self._artifacts
 
-    def _poll(self):
+    def _poll(self, tree=None):
         """
         We have to in reality poll job having artifacts ....
         In our case parent should always be a JenkinsBuild instance ...
+        :param tree:        ignored, projection of the parent build is used
         :return:
         """
         self.parent._poll()
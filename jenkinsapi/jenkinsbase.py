@@ -1,15 +1,64 @@
 from ast import literal_eval
+from hashlib import sha1
+import threading
 import time
 import jenkinsapi.misc
 import jenkinsapi.requester
+import jenkinsapi.scheduler
 import jenkinsapi.jenkins
 
 import logging
 logger = logging.getLogger(__name__)
 
+# use the fastest json decoder available, falling back to standard library
+try:
+    from ujson import loads as json_loads
+except ImportError:
+    try:
+        from simplejson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+API_JSON = 'api/json'
+API_PYTHON = 'api/python'
+
+# guards identity maps (Jenkins._jobs, JenkinsJob._builds, JenkinsQueue._items) and get-or-create in metaclasses,
+# it is reentrant, as creating an object might create (and register) other objects
+REGISTRY_LOCK = threading.RLock()
+
 __author__ = 'sedlacek'
 
 
+def get_or_create(registry, key, create, data=None, poll_interval=None, auth=None, timeout=None):
+    """
+    Double checked get-or-create of registered object (used by metaclasses of jobs, builds and queue items)
+
+    Object is created and registered (by its constructor) under REGISTRY_LOCK, but its first poll,
+    i.e. network I/O, is done after the lock is released, so slow jenkins does not block the registry.
+    :param registry:            IdentityMap the object registers itself in
+    :param key:                 objid of the object
+    :param create:              callable(data, poll_interval) calling the constructor
+    :return:                    registered object
+    """
+    res = registry.get(key)
+    if res is not None:
+        return res.__an_update__(poll_interval=poll_interval, auth=auth, timeout=timeout)
+
+    with REGISTRY_LOCK:
+        # another thread might have created the object while we were waiting for the lock
+        res = registry.get(key) if key in registry else None
+        created = res is None
+        if created:
+            # without data and poll interval constructor does not poll
+            res = create(data=None, poll_interval=None)
+            res._poll_interval = poll_interval
+
+    if not created:
+        return res.__an_update__(poll_interval=poll_interval, auth=auth, timeout=timeout)
+    # object is registered already, so other threads share it while we are polling
+    return res._start(data)
+
+
 class FakeJenkinsBase(object):
     """
     Class for sparse Jenkins object currently providing only url and does not allow cascading of jenkins objects
@@ -28,19 +77,27 @@ class FakeJenkinsBase(object):
 
 class JenkinsBase(object):
 
-    _API = 'api/python'
+    # subclasses without __slots__ get __dict__ as usual, hot classes (builds, queue items) declare their own
+    __slots__ = ('__weakref__', '_poll_lock', '_objid', '_parent', '_url', '_timeout', '_poll_interval', '_next_poll',
+                 '_last_poll', '_data', '_auth', '_requester', '_session', '_api', '_tree', '_digest', '_partial',
+                 '_scheduler', '_jenkins', '_watchers')
+
+    _API = API_JSON          # wire format, either API_JSON or API_PYTHON (slow literal_eval parsing)
     _EXTRA = None            # parent_url/EXTRA/objid
+    _TREE = None             # default field projection (jenkins tree= query), None means complete model
+    _REFRESHED_BY_PARENT = False    # parent's payload contains our complete data (scheduler does not poll us)
+    _COMPACT = False         # keep only projected fields and intern strings of polled data (saves memory)
 
     def __init__(self, parent=None, objid=None, url=None, data=None, poll_interval=None,
                  auth=None, timeout=None):
         """
         :param parent:              parent jenkins object
         :param objid:               object id in parent context
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param data:                we already got the data, so initiate the object with the data
         :param auth:                jenkins auth - either apitoken or username and pwd
         :param timeout:             timeout for API calls
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param poll_interval:       0 - data polled always when value requested
                                     >0 - interval in which data are refreshed (in seconds)
                                     None - data automatically polled only once, when data are accessed
@@ -51,6 +108,7 @@ class JenkinsBase(object):
             or (parent is not None and objid is None and url is not None),\
             'Unsupported combination of arguments: parent, objid and url.'
 
+        self._poll_lock = threading.RLock()                 # serializes polls of this object
         self.objid = objid
         self._parent = parent
         self._url = url
@@ -68,12 +126,28 @@ class JenkinsBase(object):
         self._auth = auth                                   # jenkins authentication object, either token or BasicAuth
         self._requester = None                              # requester, setup at first poll request
         self._session = None
+        self._api = None                                    # api url
+        self._tree = None                                   # per instance projection, None means class default
+        self._digest = None                                 # digest of last polled response body
+        self._partial = False                               # True if data do not cover whole projection (stub)
+        self._scheduler = None                              # PollScheduler refreshing us in the background
+        self._watchers = None                               # change callbacks [(path, callback, executor)]
+
+        self._start(data)
+        logger.debug(' Created %s object %s' % (self.__class__.__name__, repr(self)))
 
+    def _start(self, data=None):
+        """
+        First poll and registration in installed scheduler, done by constructor or by get_or_create
+        after the object is registered
+        :return:                self
+        """
         if self._poll_interval is not None or data is not None:
             self.poll(data)
 
-        self._api = None                                    # api url
-        logger.debug(' Created %s object %s' % (self.__class__.__name__, repr(self)))
+        if self._poll_interval is not None and jenkinsapi.scheduler.installed() is not None:
+            jenkinsapi.scheduler.installed().register(self)
+        return self
 
     def __an_update__(self, poll_interval=None, auth=None, timeout=None):
         """
@@ -96,37 +170,175 @@ class JenkinsBase(object):
         # and allow easy chaining ....
         return self
 
-    def poll(self, data=None, now=None):
+    def poll(self, data=None, now=None, tree=None, force=False):
         """
         Poll jenkins data, honor poll interval accordingly
         :param now:             set poll timestamp
-        :param data:            instead of polling from server use data
-        """
-        if now is None:
-            now = time.time()
-        if data is not None:
-            # we already have data, so use them for update
-            self._update_data(data=data, now=now)
-            self._update_poll(now)
-        elif self._poll_interval is None or self._next_poll <= now:
-            self._poll()
-            self._update_poll(now)
+        :param data:            instead of polling from server use data, data not covering
+                                whole projection (e.g. from parent's payload) make the object a stub
+        :param tree:            field projection used for this poll only (overrides self.tree),
+                                '' requests complete object model
+        :param force:           poll from server regardless of poll interval
+        """
+        # poll timestamp before we wait for the lock, it changes if another thread polls meanwhile
+        last = self._last_poll
+        with self._poll_lock:
+            before = self._data
+            if now is None:
+                now = time.time()
+            if data is not None:
+                data = self._compact(data)
+                partial = not self._covers(data)
+                if partial and not self._partial and self._data:
+                    # we have complete data, just refresh fields we got, complete refresh is still due as planned
+                    merged = jenkinsapi.misc.merge_all_dict(self._data, data)
+                    if merged != self._data:
+                        self._digest = None
+                        self._update_data(data=merged, now=now)
+                else:
+                    # we already have data, so use them for update, unless nothing has changed
+                    if data != self._data:
+                        self._digest = None
+                        self._update_data(data=data, now=now)
+                    self._partial = partial
+                    self._update_poll(now)
+            elif force or tree is not None or \
+                    (self._last_poll == last and (self._poll_interval is None or self._next_poll <= now)):
+                # unless forced, we do not poll again if another thread polled while we were waiting for the lock
+                self._poll(tree=tree)
+                self._partial = self._narrower(tree)
+                self._update_poll(now)
+            changes = self._changes(before) if self._watchers and self._data is not before else None
+        if changes:
+            for callback, executor, path, old, new in changes:
+                executor.submit(callback, self, path, old, new)
         return self
 
-    def auto_poll(self):
+    def on_change(self, field, callback, executor=None):
         """
-        If requested automatically refresh data, should be used in each data call
+        Call callback whenever value of field changes in polled data (e.g. build's 'building' or 'result',
+        job's 'lastBuild.number'). Callbacks fire from poll, so object must be polled by somebody -
+        best by jenkinsapi.scheduler.PollScheduler.
+
+        :param str|tuple field:     key path, either dotted string or tuple of keys
+        :param callback:            callable(obj, field, old value, new value), missing value is None
+        :param executor:            object with submit(fn, *args) method,
+                                    default is shared jenkinsapi.scheduler.default_executor()
+        :return:                    callback
+        """
+        path = tuple(field.split('.')) if isinstance(field, basestring) else tuple(field)
+        if executor is None:
+            executor = jenkinsapi.scheduler.default_executor()
+        with self._poll_lock:
+            # copy on write, so poll can iterate without a lock
+            self._watchers = (self._watchers or []) + [(path, callback, executor)]
+        return callback
+
+    def remove_on_change(self, callback):
         """
+        Remove all subscriptions of callback
+        """
+        with self._poll_lock:
+            self._watchers = [watcher for watcher in (self._watchers or []) if watcher[1] != callback] or None
+
+    @staticmethod
+    def _lookup(data, path):
+        """
+        :return:            value at key path or None if it is missing
+        """
+        for key in path:
+            if isinstance(data, dict):
+                data = data.get(key)
+            elif isinstance(data, list):
+                try:
+                    data = data[int(key)]
+                except (ValueError, IndexError):
+                    return None
+            else:
+                return None
+        return data
+
+    def _changes(self, before):
+        """
+        :param dict before:     data before the poll
+        :return list:           [(callback, executor, field, old, new)] of watched fields which have changed
+        """
+        result = []
+        for path, callback, executor in self._watchers:
+            old = self._lookup(before, path)
+            new = self._lookup(self._data, path)
+            if old != new:
+                result.append((callback, executor, '.'.join(path), old, new))
+        return result
+
+    def auto_poll(self, key=None):
+        """
+        If requested automatically refresh data, should be used in each data call
+        :param key:             data key about to be read, stub is fetched only if it does not have the key,
+                                None means all data are needed
+        """
+        if self._partial and (key is None or key not in self._data):
+            last = self._last_poll
+            with self._poll_lock:
+                if self._last_poll != last and not self._partial:
+                    # another thread has fetched complete data while we were waiting for the lock
+                    return self
+                return self.poll(force=True)
+        if self._scheduler is not None and self._last_poll != 0:
+            # scheduler keeps our data fresh, serve the last snapshot
+            return self
         if self._poll_interval is not None or self._next_poll == 0:
             return self.poll()
         else:
             return self
 
+    def _narrower(self, tree):
+        """
+        :param tree:            projection used for a poll, None means ours, '' complete object model
+        :return bool:           True if tree does not cover all fields of our projection
+        """
+        if tree is None or tree == '':
+            return False
+        fields = jenkinsapi.misc.tree_fields(self.tree)
+        # our projection is complete object model, any explicit tree is narrower
+        return not fields or not fields.issubset(jenkinsapi.misc.tree_fields(tree))
+
+    def _covers(self, data):
+        """
+        :return bool:           True if data contain all fields of our projection
+        """
+        fields = jenkinsapi.misc.tree_fields(self.tree)
+        return isinstance(data, dict) and fields.issubset(data)
+
+    @property
+    def stub(self):
+        """
+        :return bool:           True if object has only partial data (e.g. seeded from parent's payload)
+        """
+        return self._partial
+
+    @property
+    def refreshed_by_parent(self):
+        """
+        :return bool:           True if parent's latest payload contains our data, so poll of parent refreshes us
+        """
+        return (self._partial or self._REFRESHED_BY_PARENT) and isinstance(self._parent, JenkinsBase) \
+            and self._parent._in_payload(self)
+
+    def _in_payload(self, child):
+        """
+        Should be overridden by classes whose payload contains data of their children
+        :return bool:           True if our latest payload contains data of child
+        """
+        return False
+
     def purge(self):
         """
         Clean all data and retrieve complete new set from jenkins
         """
         self._data = {}
+        self._digest = None
+        self._partial = False
         self._next_poll = 0
         self._last_poll = 0
 
@@ -151,19 +363,50 @@ class JenkinsBase(object):
                 params = {}
             self._requester = jenkinsapi.requester.Requester(url=self.api, params=params,
                                         username=self.auth.auth.username, password=self.auth.auth.password,
-                                        timeout=self.timeout, session=session)
+                                        timeout=self.timeout, session=session, owner=self.__class__.__name__)
         return self._requester
 
-    def _poll(self):
+    def _poll(self, tree=None):
         """
         Real poll worker, if needed should be overridden in inherited classes
+        :param tree:        field projection, None means self.tree
         """
-        response = self.requester.get()
+        tree = jenkinsapi.misc.default(tree, self.tree)
+        response = self.requester.get(params={'tree': tree} if tree else None)
         if response.status_code != 200:
             raise jenkinsapi.misc.JenkinsApiRequestFailed('Request (%s) failed %d %s for %s' % ('GET', response.status_code, response.reason, response.url))
-        self._update_data(literal_eval(response.content))
+        digest = sha1(response.content).digest()
+        if digest == self._digest:
+            # same response as last time, no need to parse it and rebuild children
+            logger.debug(' %s not changed since last poll' % self.api)
+            return self
+        self._update_data(self._compact(self._parse(response.content)))
+        self._digest = digest
         return self
 
+    def _compact(self, data):
+        """
+        If self._COMPACT, keep only fields of our projection and intern strings
+        :param data:        parsed data
+        :return:            data to be stored
+        """
+        if not self._COMPACT or not isinstance(data, dict):
+            return data
+        fields = jenkinsapi.misc.tree_fields(self.tree)
+        if fields:
+            data = {key: value for key, value in data.iteritems() if key in fields}
+        return jenkinsapi.misc.intern_data(data)
+
+    def _parse(self, content):
+        """
+        Parse API response according to the wire format in self._API
+        :param content:     response body
+        :return:            parsed data
+        """
+        if self._API == API_PYTHON:
+            return literal_eval(content)
+        return json_loads(content)
+
     def _update_data(self, data, now=None):
         """
         Data update, should be overridden in subclasses
@@ -174,7 +417,7 @@ class JenkinsBase(object):
 
     @staticmethod
     def objid_from_url(url):
-        return jenkinsapi.misc.normalize_url(url).split('/')[-1]
+        return jenkinsapi.misc.unquote_url(jenkinsapi.misc.normalize_url(url).split('/')[-1])
 
     @property
     def objid(self):
@@ -191,12 +434,12 @@ class JenkinsBase(object):
     @objid.setter
     def objid(self, value):
         """
-        objid is always converted to string
+        objid is always converted to text (str if it is ascii, unicode otherwise)
         """
         if value is None:
             self._objid = None
         else:
-            self._objid = str(value)
+            self._objid = jenkinsapi.misc.text(value)
 
     @property
     def parent(self):
@@ -206,7 +449,7 @@ class JenkinsBase(object):
         if self._parent is not None:
             return self._parent
         if self._url is not None:
-            self._parent = FakeJenkinsBase(jenkinsapi.misc.normalize_url(self.url)[: -1 - len(self.objid) - 0 if self._EXTRA is None else (1 + len(self._EXTRA))])
+            self._parent = FakeJenkinsBase(jenkinsapi.misc.normalize_url(self.url)[: -1 - len(jenkinsapi.misc.quote_url(self.objid)) - (0 if self._EXTRA is None else (1 + len(self._EXTRA)))])
             return self._parent
         raise ValueError('Cannot guess parent API object.')
 
@@ -240,10 +483,27 @@ class JenkinsBase(object):
         if hasattr(self, '_url') and self._url is not None:
             return self._url
         if self.parent is not None and self.objid is not None:
-            self._url = jenkinsapi.misc.normalize_url(jenkinsapi.misc.join_url(self.parent.url, self._EXTRA, self.objid))
+            self._url = jenkinsapi.misc.normalize_url(jenkinsapi.misc.join_url(self.parent.url, self._EXTRA, jenkinsapi.misc.quote_url(self.objid)))
             return self._url
         raise ValueError('Cannot guess URL.')
 
+    @property
+    def tree(self):
+        """
+        :return:            field projection (jenkins tree= query) used when polling this object
+        """
+        if self._tree is not None:
+            return self._tree
+        return self._TREE
+
+    @tree.setter
+    def tree(self, value):
+        """
+        Widen or narrow the projection for this instance,
+        None restores the class default, '' requests complete object model
+        """
+        self._tree = value
+
     @property
     def poll_interval(self):
         return self._poll_interval
@@ -252,6 +512,12 @@ class JenkinsBase(object):
     def poll_interval(self, value):
         self._poll_interval = value
         self._update_poll(self._last_poll)
+        scheduler = jenkinsapi.misc.default(self._scheduler, jenkinsapi.scheduler.installed())
+        if scheduler is not None:
+            if value is None:
+                scheduler.unregister(self)
+            else:
+                scheduler.register(self)
 
     @property
     def auth(self):
@@ -341,7 +607,7 @@ class JenkinsBase(object):
         return self._data.__len__()
 
     def __getitem__(self, item):
-        self.auto_poll()
+        self.auto_poll(item)
         return self._data.__getitem__(item)
 
     def __setitem__(self, key, value):
@@ -355,9 +621,9 @@ class JenkinsBase(object):
         return self._data.__iter__()
 
     def __contains__(self, item):
-        self.auto_poll()
+        self.auto_poll(item)
         return self._data.__contains__(item)
 
     def get(self, key, default=None):
-        self.auto_poll()
+        self.auto_poll(key)
         return self._data.get(key, default)
@@ -3,6 +3,7 @@ import jenkinsapi.jenkinsjob
 import jenkinsapi.misc
 import jenkinsapi.requester
 import jenkinsapi.jenkinsartifacts
+import jenkinsapi.console
 
 from time import sleep, time
 
@@ -25,32 +26,36 @@ class _JenkinsBuild(type):
             'Either url or objid can be defined, but not both!'
         myjob = parent
 
-        if myjob is not None:
-            # ok parent is instance of Jenkins
-            try:
-                res = myjob.builds[objid if objid is not None else JenkinsBuild.objid_from_url(url)]
-                res.__an_update__(poll_interval=poll_interval, auth=auth, timeout=timeout)
-                return res
-            except KeyError:
-                pass
-        return super(_JenkinsBuild, cls).__call__(parent=parent, objid=objid, url=url, data=data,
-                                                            poll_interval=poll_interval, auth=auth, timeout=timeout)
+        create = lambda data, poll_interval: super(_JenkinsBuild, cls).__call__(
+            parent=parent, objid=objid, url=url, data=data, poll_interval=poll_interval, auth=auth, timeout=timeout)
+        if isinstance(myjob, jenkinsapi.jenkinsjob.JenkinsJob):
+            # ok parent is instance of JenkinsJob, lookup and creation must be atomic,
+            # otherwise two threads might create the same build
+            return jenkinsapi.jenkinsbase.get_or_create(myjob._builds,
+                                                        objid if objid is not None else JenkinsBuild.objid_from_url(url),
+                                                        create, data=data, poll_interval=poll_interval,
+                                                        auth=auth, timeout=timeout)
+        return create(data=data, poll_interval=poll_interval)
 
 
 class JenkinsBuild(jenkinsapi.jenkinsbase.JenkinsBase):
 
     __metaclass__ = _JenkinsBuild
+    __slots__ = ('_console_text_size', '_console_more_data', '_job', '_artifacts')
+    _COMPACT = True
+    _TREE = 'number,url,result,building,timestamp,duration,estimatedDuration,' \
+            'artifacts[displayPath,fileName,relativePath]'
 
     def __init__(self, parent=None, objid=None, url=None, data=None, poll_interval=None,
                  auth=None, timeout=None):
         """
         :param parent:              parent jenkins object
         :param objid:               object id in parent context
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param data:                we already got the data, so initiate the object with the data
         :param auth:                jenkins auth - either apitoken or username and pwd
         :param timeout:             timeout for API calls
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param poll_interval:       0 - data polled al  ways when value requested
                                     >0 - interval in which data are refreshed (in seconds)
                                     None - data automatically polled only once, when data are accessed
@@ -85,7 +90,7 @@ class JenkinsBuild(jenkinsapi.jenkinsbase.JenkinsBase):
 
     @property
     def ok(self):
-        self.auto_poll()
+        self.auto_poll('result')
         try:
             return self['result'] == 'SUCCESS'
         except KeyError:
@@ -93,7 +98,7 @@ class JenkinsBuild(jenkinsapi.jenkinsbase.JenkinsBase):
 
     @property
     def failed(self):
-        self.auto_poll()
+        self.auto_poll('result')
         try:
             return self['result'] == 'FAILURE'
         except KeyError:
@@ -101,7 +106,7 @@ class JenkinsBuild(jenkinsapi.jenkinsbase.JenkinsBase):
 
     @property
     def aborted(self):
-        self.auto_poll()
+        self.auto_poll('result')
         try:
             return self['result'] == 'ABORTED'
         except KeyError:
@@ -109,7 +114,7 @@ class JenkinsBuild(jenkinsapi.jenkinsbase.JenkinsBase):
 
     @property
     def isbuilding(self):
-        self.auto_poll()
+        self.auto_poll('building')
         return self['building']
 
     @property
@@ -120,79 +125,109 @@ class JenkinsBuild(jenkinsapi.jenkinsbase.JenkinsBase):
         return self._artifacts
 
 
-    def console(self, poll_interval=1, reset=False):
+    def console_reader(self, start=None, poll_interval=1, encoding=None, errors='replace', chunk_size=None,
+                       ceiling=None, resume=None):
+        """
+        :param start:               byte offset to start from, None means continue where last reading stopped
+        :param resume:              file persisting offset of consumed console (see ConsoleReader)
+        :return ConsoleReader:      streaming reader of console, see jenkinsapi.console.ConsoleReader
+        """
+        return jenkinsapi.console.ConsoleReader(self, start=start, poll_interval=poll_interval, encoding=encoding,
+                                                errors=errors, chunk_size=chunk_size, ceiling=ceiling, resume=resume)
+
+    def console_tail(self, lines=None, count=None):
+        """
+        Last lines (or last count bytes) of console, without downloading the whole console
+
+        :param int lines:           number of lines
+        :param int count:           number of bytes, used if lines is None
+        :return list:               lines (without line terminators)
+        """
+        if lines is None and count is None:
+            raise ValueError('Either lines or count must be defined.')
+        reader = self.console_reader(poll_interval=0)
+        if lines is not None:
+            return reader.tail_lines(lines)
+        # single request reads up to the current end of console
+        return ''.join(reader.tail_bytes(count).fetch()).splitlines()
+
+    def console_to_file(self, target, compress=None, level=None, resume=True, poll_interval=1, index=False):
+        """
+        Stream raw console to a file, see jenkinsapi.console.ConsoleSink
+
+        :param target:              file name or file-like object opened for binary writing
+        :param str compress:        None, 'gzip' or 'zstd'
+        :param int level:           compression level
+        :param bool resume:         continue interrupted download of target file
+        :param poll_interval:       first wait of idle console polling
+        :param bool index:          build line index of the file (see jenkinsapi.consoleindex.LineIndex)
+        :return dict:               throughput stats
+        """
+        reader = self.console_reader(start=0, poll_interval=poll_interval)
+        return jenkinsapi.console.ConsoleSink(reader, target, compress=compress, level=level, resume=resume,
+                                              index=index).run()
+
+    def console_search(self, patterns, callback=None, stop=True, start=0, poll_interval=1):
+        """
+        Scan console for patterns, see jenkinsapi.console.ConsoleReader.search
+
+        :param patterns:            dict {name: pattern} or list of patterns (strings or compiled)
+        :param callback:            callable(ConsoleMatch), returning True stops following
+        :param bool stop:           stop following console on the first match
+        :param start:               byte offset to start from, None means continue where last reading stopped
+        :return ConsoleMatch:       first match or None
+        """
+        return self.console_reader(start=start, poll_interval=poll_interval).search(patterns, callback=callback,
+                                                                                   stop=stop)
+
+    def console(self, poll_interval=1, reset=False, start=None):
         """
         yield next console line, or None (if polling is off)
         or raise jenkinsapi.misc.JenkinsNoMoreConsoleData if we already read all the lines
 
+        Console is streamed, lines split between progressive chunks are reassembled.
 
         :type poll_interval:        0 or None, means no polling, >0 means polling in seconds
-                                    default is 1 second
+                                    default is 1 second, idle console is polled less and less often
+                                    (up to jenkinsapi.console.CONSOLE_POLL_CEILING)
         :param reset:               reset counters and starts polling console from the first line
+        :param start:               starts polling console from byte offset
         """
         if reset:
-            self._console_text_size = 0
-            self._console_more_data = True
-
-        if not self._console_more_data:
-            # well, we are behind the end
-            raise jenkinsapi.misc.JenkinsNoMoreConsoleData
-
-        url = jenkinsapi.misc.normalize_url(jenkinsapi.misc.join_url(self.url, 'logText/progressiveText'))
-
-        while True:
-            #Iterate trough console, console data
-            request = self.requester.post(url=url, data={'start': self._console_text_size})
-
-            try:
-                # Should we expect more lines?
-                self._console_more_data = request.headers['x-more-data'] == 'true'
-            except KeyError:
-                self._console_more_data = False
-            # noinspection PyBroadException
-            try:
-                logger.debug('console: x-text-size=%d, x-more-data=%s' %
-                             (int(request.headers['x-text-size']), self._console_more_data))
-                newsize = int(request.headers['x-text-size'])
-                # we did not receive eny update ...
-                if self._console_text_size == newsize:
-                    if poll_interval is None or poll_interval == 0:
-                        # well we do not want to do polling here, so yield None
-                        yield None
-                    else:
-                        # lets wait and poll again
-                        sleep(poll_interval)
-                        continue
-                self._console_text_size = newsize
-            except Exception as e:
-                # broken console protocol, lets raise an exception here
-                raise ValueError('Cannot get console text size :(%s)' % str(e))
-            for line in request.content.splitlines():
-                yield line
-            if not self._console_more_data:
-                # nothing more to process...
-                break
-
-    def block(self, poll_interval):
-        """
-        :param poll_interval:       poll interval, default 1 second
+            start = 0
+        return self.console_reader(start=start, poll_interval=poll_interval).iter_lines()
+
+    @property
+    def remaining(self):
+        """
+        :return float:              estimated seconds until the build finishes (negative when overdue),
+                                    None if jenkins has no estimate
+        """
+        timestamp = self.get('timestamp')
+        estimate = self.get('estimatedDuration')
+        if not timestamp or estimate is None or estimate <= 0:
+            return None
+        return (timestamp + estimate) / 1000.0 - time()
+
+    def block(self, poll_interval=None, floor=None, ceiling=None):
+        """
+        :param poll_interval:       fixed poll interval, None means adaptive interval based on build's
+                                    estimated duration (see jenkinsapi.misc.AdaptiveWait)
+        :param floor:               shortest adaptive poll interval
+        :param ceiling:             longest adaptive poll interval
         :return:                    self
         """
         start_time = time()
         block_warning = True
 
-        if poll_interval is None:
-            if self.poll_interval is not None and self.poll_interval > 0:
-                poll_interval = self.poll_interval
-            else:
-                # set default
-                poll_interval = jenkinsapi.misc.DEFAULT_POLL_INTERVAL
-        assert poll_interval >= 1, 'Insanely short poll_interval (%f)' % poll_interval
-        while self.poll().isbuilding:
+        if poll_interval is not None:
+            assert poll_interval >= 1, 'Insanely short poll_interval (%f)' % poll_interval
+        wait = jenkinsapi.misc.AdaptiveWait(floor=floor, ceiling=ceiling)
+        while self.poll(force=True).isbuilding:
             if time() - start_time > BLOCK_TIMEOUT:
-                raise RuntimeError('Item %s is building more then %d seconds' % self.url, BLOCK_TIMEOUT)
+                raise RuntimeError('Item %s is building more then %d seconds' % (self.url, BLOCK_TIMEOUT))
             if time() - start_time > BLOCK_WARNING and block_warning:
                 logger.warning('Waiting for %s build for more then %d seconds' % (self.url, BLOCK_WARNING))
                 block_warning = False
-            sleep(poll_interval)
-        return self
\ No newline at end of file
+            sleep(poll_interval if poll_interval is not None else wait.next(self.remaining))
+        return self
@@ -6,6 +6,7 @@ import jenkinsapi.misc
 import jenkinsapi.jenkinsqueueitem
 import jenkinsapi.jenkinsbuild
 import jenkinsapi.jenkinsqueue
+import jenkinsapi.identitymap
 
 from time import time
 from random import randint
@@ -17,6 +18,8 @@ logger = logging.getLogger(__name__)
 
 __author__ = 'sedlacek'
 
+BUILDS_PAGE = 100           # number of build references fetched at once when paging build history
+
 class _JenkinsJobMeta(type):
     """
     Lets make sure that when parent is jenkins, any job is properly registered there
@@ -28,39 +31,260 @@ class _JenkinsJobMeta(type):
                  auth=None, timeout=None):
         assert (objid is None and url is not None) or (objid is not None and url is None), \
             'Either url or objid can be defined, but not both!'
+        create = lambda data, poll_interval: super(_JenkinsJobMeta, cls).__call__(
+            parent=parent, objid=objid, url=url, data=data, poll_interval=poll_interval, auth=auth, timeout=timeout)
         if isinstance(parent, jenkinsapi.jenkins.Jenkins):
-            # ok parent is instance of Jenkins
-            try:
-                res = parent._jobs[objid if objid is not None else JenkinsJob.objid_from_url(url)]
-                res.__an_update__(poll_interval=poll_interval, auth=auth, timeout=timeout)
-                return res
-            except KeyError:
-                pass
-        return super(_JenkinsJobMeta, cls).__call__(parent=parent, objid=objid, url=url, data=data,
-                                                            poll_interval=poll_interval, auth=auth, timeout=timeout)
+            # ok parent is instance of Jenkins, lookup and creation must be atomic,
+            # otherwise two threads might create the same job
+            return jenkinsapi.jenkinsbase.get_or_create(parent._jobs,
+                                                        jenkinsapi.misc.text(objid) if objid is not None
+                                                        else JenkinsJob.objid_from_url(url),
+                                                        create, data=data, poll_interval=poll_interval,
+                                                        auth=auth, timeout=timeout)
+        return create(data=data, poll_interval=poll_interval)
+
+
+class JenkinsBuildIndex(object):
+    """
+    Builds of a job keyed by build number
+
+    Index keeps only build references (number and url), JenkinsBuild objects are created on demand.
+    Older history is paged in using jenkins allBuilds{M,N} range syntax only when a query needs it.
+    Range is positional (0 is the newest build), so position of the oldest paged build is recomputed
+    before each page, as new builds shift the history.
+
+    As the former {objid: JenkinsBuild} dict, keys are build objids (strings), lookups accept
+    both objids and numbers, numbers() returns build numbers as ints.
+    """
+
+    def __init__(self, job):
+        """
+        :param JenkinsJob job:      job owning the builds
+        """
+        self._job = job
+        self._refs = {}                 # {build number: build url}
+        self._oldest = None             # we have references for all builds from the newest one down to this number
+        self._complete = False          # True if we have references for whole history
+
+    def update(self, refs):
+        """
+        Update index with newest builds (as returned in job's 'builds')
+        :param list refs:           list of dicts with number and url, newest first
+        """
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            numbers = set(ref['number'] for ref in refs)
+            if numbers:
+                oldest = min(numbers)
+                if self._oldest is None or not self._contiguous(oldest):
+                    # more new builds than we got, so there might be a gap behind what we have paged in
+                    self._oldest = oldest
+                    self._complete = False
+                # builds deleted in jenkins in the range we got
+                deleted = [number for number in self._refs if number > oldest and number not in numbers]
+                for number in deleted:
+                    del self._refs[number]
+                if deleted and self._oldest < oldest:
+                    # older builds might have been deleted as well, so pages we have are stale, page them again
+                    for number in [number for number in self._refs if number < oldest]:
+                        del self._refs[number]
+                    self._oldest = oldest
+                    self._complete = False
+            for ref in refs:
+                self._refs[ref['number']] = ref['url']
+        return self
+
+    def _contiguous(self, oldest):
+        """
+        :return bool:               True if newest builds down to oldest join history we have paged in
+        """
+        newer = [number for number in self._refs if number >= self._oldest]
+        return bool(newer) and oldest <= max(newer)
+
+    def add(self, refs):
+        """
+        Add build references (e.g. firstBuild or lastBuild) without any assumption about their position
+        :param list refs:           list of dicts with number and url
+        """
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            for ref in refs:
+                self._refs[ref['number']] = ref['url']
+        return self
+
+    def fetch(self, start, end):
+        """
+        Fetch references of builds in positions start (inclusive) .. end (exclusive), 0 is the newest build
+        :return list:               references received (dicts with number and url), newest first
+        """
+        response = self._job.requester.get(params={'tree': 'allBuilds[number,url]{%d,%d}' % (start, end)})
+        if response.status_code != 200:
+            raise jenkinsapi.misc.JenkinsApiRequestFailed('Request (%s) failed %d %s for %s'
+                                                          % ('GET', response.status_code, response.reason,
+                                                             response.url))
+        refs = self._job._parse(response.content).get('allBuilds', [])
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            if refs:
+                # page is contiguous part of history, builds missing in it were deleted in jenkins
+                newest, oldest = refs[0]['number'], refs[-1]['number']
+                if len(refs) < end - start:
+                    # page reached the end of history, there are no older builds
+                    oldest = 0
+                for number in [number for number in self._refs if oldest < number < newest]:
+                    del self._refs[number]
+            for ref in refs:
+                self._refs[ref['number']] = ref['url']
+        return refs
+
+    def _page(self):
+        """
+        Page in BUILDS_PAGE builds older than the oldest paged build
+        """
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            oldest = self._oldest
+            known = len(self._refs)
+            # position of the oldest paged build, builds started since the last poll make it only
+            # an estimate, but the page starts on it, so we see whether we have missed anything
+            start = len([number for number in self._refs if number > oldest]) if oldest is not None else 0
+        while True:
+            refs = self.fetch(start, start + BUILDS_PAGE)
+            if oldest is None or start == 0 or (refs and refs[0]['number'] >= oldest):
+                break
+            # builds deleted in jenkins moved the history towards the newest build, we would skip some
+            start = max(0, start - BUILDS_PAGE)
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            if refs and (self._oldest is None or refs[-1]['number'] < self._oldest):
+                self._oldest = refs[-1]['number']
+            elif len(self._refs) == known:
+                # page brought nothing new, so there is nothing more to page in
+                self._complete = True
+            if len(refs) < BUILDS_PAGE:
+                self._complete = True
+
+    def _page_until(self, predicate):
+        """
+        Page in older history until predicate() is True or there is no more history
+        """
+        while not predicate() and not self._complete:
+            self._page()
+
+    def _paged(self):
+        """
+        :return int:                number of builds from the newest one we have references for
+        """
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            if self._oldest is None:
+                return 0
+            return len([number for number in self._refs if number >= self._oldest])
+
+    def _older(self, number):
+        """
+        :return bool:               True if we have paged in history down to build number
+        """
+        return number in self._refs or (self._oldest is not None and self._oldest <= number)
+
+    def numbers(self):
+        """
+        :return list:               known build numbers, newest first
+        """
+        self._job.auto_poll('builds')
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            return sorted(self._refs, reverse=True)
+
+    def build(self, number):
+        """
+        :return JenkinsBuild:       build object, created if needed (older history is paged in if needed)
+        """
+        number = int(number)
+        self._page_until(lambda: self._older(number))
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            url = self._refs[number]
+        return jenkinsapi.jenkinsbuild.JenkinsBuild(parent=self._job, url=url,
+                                                    poll_interval=self._job.poll_interval,
+                                                    auth=self._job.auth, timeout=self._job.timeout)
+
+    def last(self, count):
+        """
+        :return list:               last count builds, newest first
+        """
+        self._job.auto_poll('builds')
+        self._page_until(lambda: self._paged() >= count)
+        return [self.build(number) for number in self.numbers()[:count]]
+
+    def between(self, first, last):
+        """
+        :return list:               builds with first <= number <= last, newest first
+        """
+        self._job.auto_poll('builds')
+        self._page_until(lambda: self._older(first))
+        return [self.build(number) for number in self.numbers() if first <= number <= last]
+
+    def iteritems(self):
+        for number in self.numbers():
+            yield str(number), self.build(number)
+
+    def itervalues(self):
+        for number in self.numbers():
+            yield self.build(number)
+
+    def keys(self):
+        return [str(number) for number in self.numbers()]
+
+    def get(self, number, default=None):
+        try:
+            return self[number]
+        except KeyError:
+            return default
+
+    def __getitem__(self, number):
+        self._job.auto_poll('builds')
+        return self.build(number)
+
+    def __contains__(self, number):
+        self._job.auto_poll('builds')
+        try:
+            number = int(number)
+        except ValueError:
+            return False
+        self._page_until(lambda: self._older(number))
+        return number in self._refs
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        self._job.auto_poll('builds')
+        return len(self._refs)
 
 
 class JenkinsJob(jenkinsapi.jenkinsbase.JenkinsBase):
 
     __metaclass__ = _JenkinsJobMeta
     _EXTRA = 'job'
+    _TREE = 'name,url,color,' \
+            'actions[parameterDefinitions[name,description,type,defaultParameterValue[value]]],' \
+            'builds[number,url],firstBuild[number,url],' \
+            'lastBuild[number,url,result,building,timestamp,duration,estimatedDuration]'
 
     def __init__(self, parent=None, objid=None, url=None, data=None, poll_interval=None,
                  auth=jenkinsapi.requester.JenkinsAuth(), timeout=None):
         """
         :param parent:              parent jenkins object
         :param objid:               object id in parent context
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param data:                we already got the data, so initiate the object with the data
         :param auth:                jenkins auth - either apitoken or username and pwd
         :param timeout:             timeout for API calls
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param poll_interval:       0 - data polled always when value requested
                                     >0 - interval in which data are refreshed (in seconds)
                                     None - data automatically polled only once, when data are accessed
         """
-        self._builds = {}
-        self._firstbuild = None
+        # created build objects {objid: JenkinsBuild}, running builds are never released
+        self._builds = jenkinsapi.identitymap.IdentityMap(maxsize=jenkinsapi.misc.BUILDS_CACHE_SIZE,
+                                                          maxage=jenkinsapi.misc.BUILDS_CACHE_AGE,
+                                                          pin=self._pin_build)
+        self._index = JenkinsBuildIndex(self)
+        self._firstbuild = None             # number of the first build
+        self._lastbuild = None              # last build, hydrated from our payload
         super(JenkinsJob, self).__init__(parent=parent,
                                          objid=objid,
                                          url=url,
@@ -77,7 +301,18 @@ class JenkinsJob(jenkinsapi.jenkinsbase.JenkinsBase):
 
     @property
     def builds(self):
-        return self._builds
+        """
+        :return JenkinsBuildIndex:  builds keyed by build number, created on demand
+        """
+        return self._index
+
+    @property
+    def last_build(self):
+        """
+        :return JenkinsBuild:       last build (seeded with data from job's payload) or None
+        """
+        self.auto_poll('lastBuild')
+        return self._lastbuild
 
     @property
     def parameters(self):
@@ -95,6 +330,19 @@ class JenkinsJob(jenkinsapi.jenkinsbase.JenkinsBase):
                             }
         return result
 
+    @staticmethod
+    def _pin_build(build):
+        """
+        Running build must stay in registry, finished one can be recreated any time
+        """
+        return build._data.get('building', False)
+
+    def build_cache_stats(self):
+        """
+        :return dict:       statistics of build registry, see IdentityMap.stats
+        """
+        return self._builds.stats()
+
     def update_build_ref(self, otherbuild):
         """
         Updating build reference
@@ -102,19 +350,17 @@ class JenkinsJob(jenkinsapi.jenkinsbase.JenkinsBase):
         :param otherbuild:      JenkinsBuild instance
         :return:                updated queue item
         """
-        try:
-            mybuild = self._builds[otherbuild.objid]
-
-            # we want to compare objects only if they are not the same
-            if mybuild != otherbuild and mybuild < otherbuild:
-                mybuild.__an_update__(auth=otherbuild.auth, poll_interval=otherbuild.poll_interval,
-                                      timeout=otherbuild.timeout)
-                # now merge the data
-                mybuild.poll(data=otherbuild.data, now=otherbuild.last_poll)
-        except KeyError:
-            self._builds[otherbuild.objid] = otherbuild
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            mybuild = self._builds.setdefault(otherbuild.objid, otherbuild)
+
+        # we want to compare objects only if they are not the same
+        if mybuild != otherbuild and mybuild < otherbuild:
+            mybuild.__an_update__(auth=otherbuild.auth, poll_interval=otherbuild.poll_interval,
+                                  timeout=otherbuild.timeout)
+            # now merge the data (poll takes object's own lock)
+            mybuild.poll(data=otherbuild._data, now=otherbuild.last_poll)
 
-        return self._builds[otherbuild.objid]
+        return mybuild
 
     def delete_build_ref(self, build):
         """
@@ -129,27 +375,44 @@ class JenkinsJob(jenkinsapi.jenkinsbase.JenkinsBase):
             buildid = build
 
         # delete from job list
-        del self._builds[buildid]
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            self._builds.pop(buildid, None)
         return self
 
+    def _in_payload(self, child):
+        # only last build is nested in our payload
+        return child is self._lastbuild
+
     def _update_data(self, data, now=None):
         super(JenkinsJob, self)._update_data(data=data, now=now)
 
-        for build in self._data['builds']:
-            self.update_build_ref(jenkinsapi.jenkinsbuild.JenkinsBuild(parent=self,
-                                                                       url=build['url'],
-                                                                       poll_interval=self.poll_interval,
-                                                                       auth=self.auth,
-                                                                       timeout=self.timeout))
+        # projection might be narrowed by caller, so builds does not have to be there
+        # builds are only indexed, objects are created when requested
+        if 'builds' in self._data:
+            self._index.update(self._data['builds'])
         with jenkinsapi.misc.IgnoreKeyError():
             if self._data['firstBuild'] is None:
                 self._firstbuild = None
             else:
-                self._firstbuild = jenkinsapi.jenkinsbuild.JenkinsBuild(parent=self,
-                                                                        url=self._data['firstBuild']['url'],
-                                                                        poll_interval=self.poll_interval,
-                                                                        auth=self.auth,
-                                                                        timeout=self.timeout)
+                self._firstbuild = self._data['firstBuild']['number']
+                self._index.add([self._data['firstBuild']])
+        with jenkinsapi.misc.IgnoreKeyError():
+            self._lastbuild = self._hydrate_build(self._data['lastBuild'], now=now)
+
+    def _hydrate_build(self, data, now=None):
+        """
+        Create or update build from data nested in our payload, no request is issued
+        :param data:                build data, must contain at least number and url
+        :return JenkinsBuild:       build or None if data is None
+        """
+        if data is None:
+            return None
+        self._index.add([data])
+        build = jenkinsapi.jenkinsbuild.JenkinsBuild(parent=self, url=data['url'], data=data,
+                                                     poll_interval=self.poll_interval,
+                                                     auth=self.auth, timeout=self.timeout)
+        # build might have existed already, then it did not get the data
+        return build.poll(data=data, now=now)
 
     def enqueue_build(self, cause=None, params=None, files=None):
         """
@@ -2,6 +2,9 @@ import jenkinsapi.jenkinsbase
 import jenkinsapi.jenkinsqueueitem
 import jenkinsapi.requester
 import jenkinsapi.jenkins
+import jenkinsapi.identitymap
+import jenkinsapi.misc
+import jenkinsapi.reconcile
 
 
 __author__ = 'sedlacek'
@@ -38,22 +41,27 @@ class JenkinsQueue(jenkinsapi.jenkinsbase.JenkinsBase):
     """
 
     __metaclass__ = _JenkinsQueueMeta
+    _TREE = 'items[id,url,cancelled,task[name,url,color],executable[number,url],actions[parameters[name,value]]]'
 
     def __init__(self, parent=None, objid=None, url=None, data=None, poll_interval=None,
                  auth=jenkinsapi.requester.JenkinsAuth(), timeout=None):
         """
         :param parent:              parent jenkins object
         :param objid:               object id in parent context
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param data:                we already got the data, so initiate the object with the data
         :param auth:                jenkins auth - either apitoken or username and pwd
         :param timeout:             timeout for API calls
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param poll_interval:       0 - data polled always when value requested
                                     >0 - interval in which data are refreshed (in seconds)
                                     None - data automatically polled only once, when data are accessed
         """
-        self._items = {}
+        # items waiting in the queue are never released
+        self._reconciler = jenkinsapi.reconcile.Reconciler(key=lambda item: str(item['id']))
+        self._items = jenkinsapi.identitymap.IdentityMap(maxsize=jenkinsapi.misc.QUEUE_CACHE_SIZE,
+                                                         maxage=jenkinsapi.misc.QUEUE_CACHE_AGE,
+                                                         pin=self._pin_item)
         super(JenkinsQueue, self).__init__(parent=parent,
                                            objid=objid,
                                            url=url,
@@ -66,27 +74,73 @@ class JenkinsQueue(jenkinsapi.jenkinsbase.JenkinsBase):
     @property
     def items(self):
         self.auto_poll()
-        return self._items
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            return dict(self._items)
+
+    @staticmethod
+    def _pin_item(item):
+        """
+        Item waiting in the queue must stay in registry
+        """
+        return item._data.get('executable') is None and not item._data.get('cancelled', False)
+
+    def item_cache_stats(self):
+        """
+        :return dict:       statistics of queue item registry, see IdentityMap.stats
+        """
+        return self._items.stats()
+
+    def on_items_change(self, callback):
+        """
+        Register callback called after each poll which added, removed or changed any queue item
+        :param callback:    callable(jenkinsapi.reconcile.ChangeSet), keys are queue item ids
+        :return:            callback
+        """
+        return self._reconciler.subscribe(callback)
+
+    def remove_items_change(self, callback):
+        self._reconciler.unsubscribe(callback)
+
+    def _poll(self, tree=None):
+        super(JenkinsQueue, self)._poll(tree=tree)
+        # items might have been registered since the last poll, even if our payload has not changed
+        return self._prune()
+
+    def _prune(self):
+        """
+        Delete all queue items which are no longer in jenkins queue, registry might contain items we have
+        never seen in our payload (e.g. created from location of enqueued build), so registry is compared
+        with the last payload
+        :return:            self
+        """
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            for key in set(self._items.keys()) - set(self._reconciler.snapshot):
+                self.delete_queueitem_ref(key)
+        return self
+
+    def _in_payload(self, child):
+        return isinstance(child, jenkinsapi.jenkinsqueueitem.JenkinsQueueItem) and child.objid in self._reconciler
 
     def _update_data(self, data, now=None):
         """
         We would like to have in the queue real queue items ...
         :param now:
         """
-        # store all the item keys
-        keystoremove = self._items.keys()
-        for item in data['items']:
+        self._data = data
+        changes = self._reconciler.reconcile(data.get('items', []))
+        self._prune()
+        # items are created and updated outside of registry lock, as poll takes item's own lock
+        for item in data.get('items', []):
             itemid = str(item['id'])
-            if itemid in self._items:
-                self._items[itemid].poll(data=item, now=now)
-                keystoremove.remove(itemid)
+            myitem = self._items.get(itemid)
+            if myitem is not None:
+                myitem.poll(data=item, now=now)
             else:
-                jenkinsapi.jenkinsqueueitem.JenkinsQueueItem(parent=self.parent,  objid=itemid, data=item,
+                # new item or item released by registry (get-or-create is atomic in JenkinsQueueItem metaclass)
+                jenkinsapi.jenkinsqueueitem.JenkinsQueueItem(parent=self, objid=itemid, data=item,
                                                              poll_interval=self.poll_interval,
                                                              auth=self.auth, timeout=self.timeout)
-        # and now delete all queue items which are no longer in jenkins queue
-        for key in keystoremove:
-            self.delete_queueitem_ref(key)
+        self._reconciler.notify(changes)
 
 
     def update_queueitem_ref(self, otheritem):
@@ -96,19 +150,17 @@ class JenkinsQueue(jenkinsapi.jenkinsbase.JenkinsBase):
         :param queueitem:       JenkinsQueueItem instance
         :return:                updated queue item
         """
-        try:
-            myitem = self._items[otheritem.objid]
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            myitem = self._items.setdefault(otheritem.objid, otheritem)
 
-            # we want to compare objects only if they are not the same
-            if myitem != otheritem and myitem < otheritem:
-                myitem.__an_update__(auth=otheritem.auth, poll_interval=otheritem.poll_interval,
-                                   timeout=otheritem.timeout)
-                # now merge the data
-                myitem.poll(data=otheritem.data, now=otheritem.last_poll)
-        except KeyError:
-            self._items[otheritem.objid] = otheritem
+        # we want to compare objects only if they are not the same
+        if myitem != otheritem and myitem < otheritem:
+            myitem.__an_update__(auth=otheritem.auth, poll_interval=otheritem.poll_interval,
+                                 timeout=otheritem.timeout)
+            # now merge the data (poll takes object's own lock)
+            myitem.poll(data=otheritem._data, now=otheritem.last_poll)
 
-        return self._items[otheritem.objid]
+        return myitem
 
     def delete_queueitem_ref(self, item):
         """
@@ -123,6 +175,7 @@ class JenkinsQueue(jenkinsapi.jenkinsbase.JenkinsBase):
             itemid = item
 
         # delete from job list
-        del self._items[itemid]
+        with jenkinsapi.jenkinsbase.REGISTRY_LOCK:
+            self._items.pop(itemid, None)
         return self
 
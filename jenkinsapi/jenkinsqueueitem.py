@@ -29,20 +29,20 @@ class _JenkinsQueueItemMeta(type):
         elif isinstance(parent, jenkinsapi.jenkinsqueue.JenkinsQueue):
             myqueue = parent
         elif isinstance(parent, jenkinsapi.jenkinsjob.JenkinsJob) and isinstance(parent.jenkins, jenkinsapi.jenkins.Jenkins):
-            myqueue = parent.jenkins.queueu
+            myqueue = parent.jenkins.queue
         else:
             myqueue = None
 
+        create = lambda data, poll_interval: super(_JenkinsQueueItemMeta, cls).__call__(
+            parent=myqueue, objid=objid, url=url, data=data, poll_interval=poll_interval, auth=auth, timeout=timeout)
         if myqueue is not None:
-            # ok parent is instance of Jenkins
-            try:
-                res = myqueue._items[objid if objid is not None else JenkinsQueueItem.objid_from_url(url)]
-                res.__an_update__(poll_interval=poll_interval, auth=auth, timeout=timeout)
-                return res
-            except KeyError:
-                pass
-        return super(_JenkinsQueueItemMeta, cls).__call__(parent=myqueue, objid=objid, url=url, data=data,
-                                                            poll_interval=poll_interval, auth=auth, timeout=timeout)
+            # ok parent is instance of Jenkins, lookup and creation must be atomic,
+            # otherwise two threads might create the same item
+            return jenkinsapi.jenkinsbase.get_or_create(myqueue._items,
+                                                        objid if objid is not None else JenkinsQueueItem.objid_from_url(url),
+                                                        create, data=data, poll_interval=poll_interval,
+                                                        auth=auth, timeout=timeout)
+        return create(data=data, poll_interval=poll_interval)
 
 class JenkinsQueueItem(jenkinsapi.jenkinsbase.JenkinsBase):
     """
@@ -50,18 +50,22 @@ class JenkinsQueueItem(jenkinsapi.jenkinsbase.JenkinsBase):
     """
 
     __metaclass__ = _JenkinsQueueItemMeta
+    __slots__ = ('_build', '_job', '_queue', '_item')
+    _COMPACT = True
 
     _EXTRA = 'item'
+    _REFRESHED_BY_PARENT = True
+    _TREE = 'id,url,cancelled,task[name,url,color],executable[number,url],actions[parameters[name,value]]'
 
     def __init__(self, parent=None, objid=None, url=None, data=None, poll_interval=None, auth=jenkinsapi.requester.JenkinsAuth(), timeout=None):
         """
         :param parent:              parent jenkins object
         :param objid:               object id in parent context
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param data:                we already got the data, so initiate the object with the data
         :param auth:                jenkins auth - either apitoken or username and pwd
         :param timeout:             timeout for API calls
-        :param url:                 jenkins URL, api/python will be added to the end
+        :param url:                 jenkins URL, api/json will be added to the end
         :param poll_interval:       0 - data polled always when value requested
                                     >0 - interval in which data are refreshed (in seconds)
                                     None - data automatically polled only once, when data are accessed
@@ -100,11 +104,13 @@ class JenkinsQueueItem(jenkinsapi.jenkinsbase.JenkinsBase):
 
     def _update_data(self, data, now=None):
         super(JenkinsQueueItem, self)._update_data(data, now)
+        # job and build are seeded with data nested in our payload, so they do not need to poll
         if self._job is None:
             with jenkinsapi.misc.IgnoreKeyError():
                 if self._data['task'] is not None:
                     self._job = jenkinsapi.jenkinsjob.JenkinsJob(parent=self.jenkins,
                                                                  url=data['task']['url'],
+                                                                 data=data['task'],
                                                                  poll_interval=self._poll_interval,
                                                                  auth=self._auth,
                                                                  timeout=self._timeout)
@@ -113,6 +119,7 @@ class JenkinsQueueItem(jenkinsapi.jenkinsbase.JenkinsBase):
                 if self._data['executable'] is not None:
                     self._build = jenkinsapi.jenkinsbuild.JenkinsBuild(parent=self._job,
                                                                        url=data['executable']['url'],
+                                                                       data=data['executable'],
                                                                        poll_interval=self._poll_interval,
                                                                        auth=self._auth,
                                                                        timeout=self._timeout)
@@ -160,25 +167,24 @@ class JenkinsQueueItem(jenkinsapi.jenkinsbase.JenkinsBase):
     def inqueue(self):
         return not self.cancelled and not self.dequeued
 
-    def block(self, poll_interval=None):
+    def block(self, poll_interval=None, floor=None, ceiling=None):
         """
-        :param poll_interval:       poll interval, default 1 second
+        :param poll_interval:       fixed poll interval, None means adaptive interval growing from floor
+                                    to ceiling (see jenkinsapi.misc.AdaptiveWait)
+        :param floor:               shortest adaptive poll interval
+        :param ceiling:             longest adaptive poll interval
         :return:                    self
         """
         start_time = time()
         block_warning = True
-        if poll_interval is None:
-            if self.poll_interval is not None and self.poll_interval > 0:
-                poll_interval = self.poll_interval
-            else:
-                # set default
-                poll_interval = jenkinsapi.misc.DEFAULT_POLL_INTERVAL
-        assert poll_interval >= 1, 'Insanely short poll_interval (%f)' % poll_interval
-        while self.poll().inqueue:
+        if poll_interval is not None:
+            assert poll_interval >= 1, 'Insanely short poll_interval (%f)' % poll_interval
+        wait = jenkinsapi.misc.AdaptiveWait(floor=floor, ceiling=ceiling)
+        while self.poll(force=True).inqueue:
             if time() - start_time > BLOCK_TIMEOUT:
-                raise RuntimeError('Item %s is in the queue more then %d seconds' % self.url, BLOCK_TIMEOUT)
+                raise RuntimeError('Item %s is in the queue more then %d seconds' % (self.url, BLOCK_TIMEOUT))
             if time() - start_time > BLOCK_WARNING and block_warning:
                 logger.warning('Waiting for %s dequeue for more then %d seconds' % (self.url, BLOCK_WARNING))
                 block_warning = False
-            sleep(poll_interval)
+            sleep(poll_interval if poll_interval is not None else wait.next())
         return self
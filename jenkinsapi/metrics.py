@@ -0,0 +1,176 @@
+import re
+import threading
+from bisect import bisect_left
+from urlparse import urlparse
+
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = 'sedlacek'
+
+# upper bounds of histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)         # seconds
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)     # bytes
+
+_ID_SEGMENTS = ('job', 'view', 'item')      # path segment following these is an object id
+_NUMBER = re.compile(r'^\d+$')
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+
+def url_template(url):
+    """
+    Strip host and object ids from url, so requests to similar objects share metrics
+
+    :param url:         e.g. https://jenkins/job/myjob/12/api/json
+    :return str:        e.g. job/*/*/api/json
+    """
+    segments = [segment for segment in urlparse(url).path.split('/') if segment != '']
+    for i, segment in enumerate(segments):
+        if _NUMBER.match(segment) or (i > 0 and segments[i - 1] in _ID_SEGMENTS):
+            segments[i] = '*'
+    return '/'.join(segments)
+
+
+def add_hook(hook):
+    """
+    Register instrumentation hook, it may define any of methods
+
+        pre_request(info)           called before request is issued
+        post_request(info)          called when request finished (or failed)
+
+    info is a dict with keys method, url, template, owner (class of requesting object) and start (epoch),
+    post_request gets as well status (None on error), elapsed, bytes, retries, sleep (seconds spent in backoff)
+    and error (exception or None). Hooks are called in requesting thread, so they should be fast.
+
+    :param hook:        hook object
+    :return:            hook
+    """
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def call_hooks(name, info):
+    """
+    Call method name of all registered hooks, failing hook does not break the request
+    """
+    for hook in list(_hooks):
+        fn = getattr(hook, name, None)
+        if fn is None:
+            continue
+        # noinspection PyBroadException
+        try:
+            fn(info)
+        except Exception:
+            logger.exception(' Instrumentation hook %r failed' % hook)
+
+
+def hooks_enabled():
+    return len(_hooks) > 0
+
+
+class Histogram(object):
+    """
+    Histogram with fixed buckets
+    """
+    def __init__(self, buckets):
+        self._bounds = tuple(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)     # last one is +Inf
+        self._count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+
+    def observe(self, value):
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+        self._min = value if self._min is None else min(self._min, value)
+        self._max = value if self._max is None else max(self._max, value)
+
+    def snapshot(self):
+        """
+        :return dict:       count, sum, min, max and buckets (list of [upper bound, count], None is +Inf)
+        """
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'min': self._min,
+            'max': self._max,
+            'buckets': [[bound, count] for bound, count in zip(self._bounds + (None,), self._counts)],
+        }
+
+
+class Metrics(object):
+    """
+    Instrumentation hook collecting request counters and histograms keyed by (owner class, url template)
+
+    Usage:
+        metrics = jenkinsapi.metrics.add_hook(jenkinsapi.metrics.Metrics())
+        ...
+        metrics.snapshot()
+    """
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self._latency_buckets = latency_buckets
+        self._size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _new_series(self):
+        return {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'sleep': 0.0,
+            'bytes': 0,
+            'status': {},
+            'latency': Histogram(self._latency_buckets),
+            'size': Histogram(self._size_buckets),
+        }
+
+    def post_request(self, info):
+        key = (info['owner'], info['method'], info['template'])
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = self._new_series()
+            series['requests'] += 1
+            series['retries'] += info['retries']
+            series['sleep'] += info['sleep']
+            series['latency'].observe(info['elapsed'])
+            if info['error'] is not None:
+                series['errors'] += 1
+            else:
+                series['status'][info['status']] = series['status'].get(info['status'], 0) + 1
+            if info['bytes'] is not None:
+                series['bytes'] += info['bytes']
+                series['size'].observe(info['bytes'])
+
+    def snapshot(self, reset=False):
+        """
+        :param bool reset:  start collecting from scratch after the snapshot
+        :return list:       list of dicts, one per (owner, method, template)
+        """
+        with self._lock:
+            result = []
+            for (owner, method, template), series in sorted(self._series.iteritems()):
+                item = dict(series, owner=owner, method=method, template=template, status=dict(series['status']))
+                item['latency'] = series['latency'].snapshot()
+                item['size'] = series['size'].snapshot()
+                result.append(item)
+            if reset:
+                self._series = {}
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
@@ -1,5 +1,7 @@
 __author__ = 'sedlacek'
 
+import urllib
+
 # constants
 
 DEFAULT_POLL_INTERVAL = 5           # polling interval default for blocking operations
@@ -8,6 +10,17 @@ DEFAULT_POLL_INTERVAL = 5           # polling interval default for blocking oper
 
 BLOCK_TIMEOUT = 10800               # max block timeout in seconds
 BLOCK_WARNING = 600                 # issue a warning when in block more tne BOCK_WARNING seconds
+BLOCK_POLL_FLOOR = 1                # shortest poll interval of adaptive blocking operations
+BLOCK_POLL_CEILING = 60             # longest poll interval of adaptive blocking operations
+BLOCK_POLL_FACTOR = 1.5             # backoff factor of adaptive blocking operations
+
+# registries keep objects alive weakly, these limits apply to objects kept alive by the registry itself
+JOBS_CACHE_SIZE = None              # max jobs kept alive by Jenkins, None means unlimited
+JOBS_CACHE_AGE = None               # seconds since last use after which job is released, None means never
+BUILDS_CACHE_SIZE = 1000            # max finished builds kept alive by a job
+BUILDS_CACHE_AGE = 3600             # seconds since last use after which finished build is released
+QUEUE_CACHE_SIZE = 1000             # max dequeued items kept alive by the queue
+QUEUE_CACHE_AGE = 600               # seconds since last use after which dequeued item is released
 
 def default(value, default_if_value_is_None):
     """
@@ -60,13 +73,166 @@ def normalize_url(url_):
     """
     if url_ is None:
         return None
-    url = str(url_)
+    url = url_ if isinstance(url_, basestring) else str(url_)
     if url[-1] == '/':
         return url[:-1]
     else:
         return url
 
 
+def text(value):
+    """
+    Jenkins names may contain any characters, so we cannot simply str() them
+
+    :param value:       name, number or utf-8 encoded string
+    :return:            str if value is plain ascii, unicode otherwise
+    """
+    if not isinstance(value, basestring):
+        value = str(value)
+    if isinstance(value, str):
+        try:
+            value.decode('ascii')
+            return value
+        except UnicodeDecodeError:
+            value = value.decode('utf-8')
+    try:
+        return value.encode('ascii')
+    except UnicodeEncodeError:
+        return value
+
+
+def quote_url(value):
+    """
+    :param value:       url snippet, e.g. job name
+    :return:            url quoted utf-8 encoded value, '/' is kept
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return urllib.quote(value, safe='/')
+
+
+def unquote_url(value):
+    """
+    :param value:       url quoted url snippet
+    :return:            text of unquoted value, see text()
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return text(urllib.unquote(value))
+
+
+INTERN_MAX_LENGTH = 32              # only string values up to this length are interned (keys are interned always)
+INTERN_MAX_ENTRIES = 65536          # interning table stops growing at this size
+
+_interned = {}
+
+
+def intern_data(data):
+    """
+    Recursively replace dict keys and short string values by shared instances,
+    so thousands of objects with the same structure do not keep own copies of the same strings
+
+    :param data:        parsed API data
+    :return:            data with interned strings (dicts and lists are rebuilt)
+    """
+    if isinstance(data, dict):
+        return {_intern(key, True): intern_data(value) for key, value in data.iteritems()}
+    if isinstance(data, list):
+        return [intern_data(value) for value in data]
+    if isinstance(data, basestring):
+        return _intern(data, False)
+    return data
+
+
+def _intern(string, always):
+    try:
+        return _interned[string]
+    except (KeyError, TypeError):
+        pass
+    if isinstance(string, basestring) and (always or len(string) <= INTERN_MAX_LENGTH) \
+            and len(_interned) < INTERN_MAX_ENTRIES:
+        return _interned.setdefault(string, string)
+    return string
+
+
+_tree_fields_cache = {}
+
+
+def tree_fields(tree):
+    """
+    :param str tree:    jenkins tree projection, e.g. 'name,builds[number,url]{0,10}'
+    :return frozenset:  top level field names, e.g. {'name', 'builds'}, empty for None or ''
+    """
+    try:
+        return _tree_fields_cache[tree]
+    except KeyError:
+        pass
+    fields = set()
+    depth = 0
+    current = []
+    for char in tree or '':
+        if char in '[{':
+            depth += 1
+        elif char in ']}':
+            depth -= 1
+        elif depth == 0:
+            if char == ',':
+                fields.add(''.join(current).strip())
+                current = []
+            else:
+                current.append(char)
+    fields.add(''.join(current).strip())
+    fields.discard('')
+    _tree_fields_cache[tree] = frozenset(fields)
+    return _tree_fields_cache[tree]
+
+
+class AdaptiveWait(object):
+    """
+    Poll intervals for blocking operations
+
+    If we know when the operation should finish, we wait half of the remaining time,
+    so we poll rarely while the end is far and often close to it. If we do not know
+    (or the estimate has passed) intervals grow geometrically from floor to ceiling.
+    """
+
+    def __init__(self, floor=None, ceiling=None, factor=BLOCK_POLL_FACTOR):
+        """
+        :param float floor:         shortest interval, default BLOCK_POLL_FLOOR
+        :param float ceiling:       longest interval, default BLOCK_POLL_CEILING
+        :param float factor:        backoff factor
+        """
+        self._floor = default(floor, BLOCK_POLL_FLOOR)
+        self._ceiling = default(ceiling, BLOCK_POLL_CEILING)
+        assert 0 < self._floor <= self._ceiling, 'Invalid floor (%s) or ceiling (%s)' % (self._floor, self._ceiling)
+        self._factor = factor
+        self._backoff = self._floor
+        self._overdue = False
+
+    def next(self, remaining=None):
+        """
+        :param float remaining:     estimated seconds until the operation finishes, None if unknown
+        :return float:              seconds to wait before next poll
+        """
+        if remaining is not None and remaining > 0:
+            wait = remaining / 2.0
+        else:
+            if remaining is not None and not self._overdue:
+                # estimate has just passed, we expect the end any moment, so start from the floor
+                self._overdue = True
+                self._backoff = self._floor
+            wait = self._backoff
+            self._backoff = min(self._ceiling, self._backoff * self._factor)
+        return max(self._floor, min(self._ceiling, wait))
+
+    def reset(self):
+        """
+        Operation made progress, start backing off from the floor again
+        """
+        self._backoff = self._floor
+        self._overdue = False
+
+
 class IgnoreKeyError(object):
 
     def __enter__(self):
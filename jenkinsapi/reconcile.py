@@ -0,0 +1,119 @@
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = 'sedlacek'
+
+
+def changed_fields(old, new):
+    """
+    :param dict old:        previous item data
+    :param dict new:        current item data
+    :return frozenset:      top level fields whose values differ
+    """
+    if old is new:
+        return frozenset()
+    return frozenset(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+
+
+class ChangeSet(object):
+    """
+    Result of reconciliation
+
+        added       {key: item data} of new items
+        removed     {key: item data} of items which are gone
+        changed     {key: frozenset of changed fields} of items whose data differ
+    """
+    __slots__ = ('added', 'removed', 'changed')
+
+    def __init__(self, added=None, removed=None, changed=None):
+        self.added = added if added is not None else {}
+        self.removed = removed if removed is not None else {}
+        self.changed = changed if changed is not None else {}
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return '<ChangeSet added=%s removed=%s changed=%s>' % (sorted(self.added), sorted(self.removed),
+                                                                 sorted(self.changed))
+
+
+class Reconciler(object):
+    """
+    Diffs keyed collection from jenkins payload (jobs, queue items) against its previous snapshot
+
+    Diff takes linear time, registered listeners are called with ChangeSet when anything has changed.
+    """
+
+    def __init__(self, key):
+        """
+        :param key:         callable(item data) -> item key
+        """
+        self._key = key
+        self._snapshot = {}                 # {key: item data} from previous reconciliation
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        return dict(self._snapshot)
+
+    def __contains__(self, key):
+        """
+        :return bool:           True if item with key was in the last reconciled items
+        """
+        return key in self._snapshot
+
+    def reconcile(self, items):
+        """
+        :param list items:      current item data
+        :return ChangeSet:      what has changed since previous reconciliation
+        """
+        current = {}
+        for item in items:
+            current[self._key(item)] = item
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = current
+        changes = ChangeSet()
+        for key, item in current.iteritems():
+            old = previous.get(key)
+            if old is None:
+                changes.added[key] = item
+            elif old != item:
+                changes.changed[key] = changed_fields(old, item)
+        for key, item in previous.iteritems():
+            if key not in current:
+                changes.removed[key] = item
+        return changes
+
+    def subscribe(self, listener):
+        """
+        :param listener:        callable(ChangeSet)
+        :return:                listener
+        """
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def notify(self, changes):
+        """
+        Call listeners, failing listener does not break the others
+        :param ChangeSet changes:   result of reconcile
+        """
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            # noinspection PyBroadException
+            try:
+                listener(changes)
+            except Exception:
+                logger.exception(' Change listener %r failed' % listener)
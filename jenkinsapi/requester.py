@@ -1,18 +1,41 @@
 import requests
 import ssl
-from time import sleep
+import json
+import os
+import threading
+import sys
+from random import uniform
+from time import sleep, time
+from urlparse import urlparse
+from email.utils import parsedate_tz, mktime_tz
 from OpenSSL.SSL import ZeroReturnError
 
 from jenkinsapi.misc import default, merge_all_dict, last_not_none
+import jenkinsapi.metrics
 
 import logging
 logger = logging.getLogger(__name__)
 
 __author__ = 'sedlacek@avast.com'
 
-# workaround for not so reliable connection
+# workaround for not so reliable connection (defaults of RetryPolicy)
 RETRIES = 5             # Number of retries for connection problems
-RETRY_WAIT = 5          # wait in seconds between each retry
+RETRY_WAIT = 5          # max wait in seconds between each retry (exponential backoff is capped by it)
+RETRY_BACKOFF = 0.5     # first backoff in seconds, doubled with each retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # HTTP statuses worth retrying for idempotent requests
+RETRY_BUDGET = 10       # max retries available to a requester at once
+RETRY_BUDGET_RATIO = 0.1    # each successful request gives this fraction of retry back to the budget
+
+# detected ssl versions are cached per host
+SSL_CACHE_FILE = None   # persistent cache file (json), None means cache only in memory
+SSL_CACHE_TTL = 86400   # how long (in seconds) is detected ssl version valid
+SSL_FAILURE_TTL = 300   # how long (in seconds) is failed detection remembered (not stored in SSL_CACHE_FILE)
+
+# connection pools of shared sessions (see configure_sessions)
+POOL_CONNECTIONS = 10   # number of cached connection pools per session
+POOL_MAXSIZE = 10       # max connections kept in a pool (per host)
+POOL_BLOCK = False      # block when no free connection is available instead of opening a new one
+KEEP_ALIVE = True       # reuse connections between requests
 
 # workaround for broken ssl in python :(
 SSLVers = []
@@ -62,14 +85,209 @@ class SSLAdapter(HTTPAdapter):
 
         super(SSLAdapter, self).__init__(**kwargs)
 
-    def init_poolmanager(self, connections, maxsize, block=False):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
         self.poolmanager = PoolManager(num_pools=connections,
                                        maxsize=maxsize,
                                        block=block,
-                                       ssl_version=self.ssl_version)
+                                       ssl_version=self.ssl_version,
+                                       **pool_kwargs)
 
 # end of from https://lukasa.co.uk/2013/01/Choosing_SSL_Version_In_Requests/
 
+_ssl_cache = {}                     # {scheme://host:port: (ssl version or None, detection timestamp)}
+_ssl_cache_lock = threading.Lock()
+_ssl_host_locks = {}                # {scheme://host:port: lock held while the host is probed}
+
+
+def _ssl_cache_key(url):
+    """
+    :return str:            scheme://host:port part of the url
+    """
+    parsed = urlparse(url)
+    return '%s://%s' % (parsed.scheme, parsed.netloc.lower())
+
+
+def _load_ssl_cache(now):
+    """
+    Merge not expired entries from SSL_CACHE_FILE into memory cache
+    """
+    if SSL_CACHE_FILE is None or not os.path.exists(SSL_CACHE_FILE):
+        return
+    versions = {name: version for version, name in SSLVersStr.iteritems() if version is not None}
+    # noinspection PyBroadException
+    try:
+        with open(SSL_CACHE_FILE, 'rb') as f:
+            stored = json.load(f)
+        for key, (name, detected) in stored.iteritems():
+            if name in versions and now - detected < SSL_CACHE_TTL and key not in _ssl_cache:
+                _ssl_cache[key] = (versions[name], detected)
+    except Exception as e:
+        # broken cache is not a reason to fail, we just detect ssl version again
+        logger.warning(' Cannot read ssl cache %s (%s)' % (SSL_CACHE_FILE, str(e)))
+
+
+def _store_ssl_cache():
+    """
+    Write memory cache into SSL_CACHE_FILE
+    """
+    if SSL_CACHE_FILE is None:
+        return
+    # noinspection PyBroadException
+    try:
+        tmpfile = '%s.%d.tmp' % (SSL_CACHE_FILE, os.getpid())
+        with open(tmpfile, 'wb') as f:
+            json.dump({key: (SSLVersStr[version], detected) for key, (version, detected) in _ssl_cache.iteritems()
+                       if version is not None}, f)
+        os.rename(tmpfile, SSL_CACHE_FILE)
+    except Exception as e:
+        logger.warning(' Cannot write ssl cache %s (%s)' % (SSL_CACHE_FILE, str(e)))
+
+
+def _cached_ssl_version(key, now):
+    """
+    Lookup in memory cache, expired entries are dropped (caller holds _ssl_cache_lock)
+
+    :return tuple:          (ssl version or None for failed detection, detection timestamp), None if not cached
+    """
+    entry = _ssl_cache.get(key)
+    if entry is not None and now - entry[1] >= (SSL_CACHE_TTL if entry[0] is not None else SSL_FAILURE_TTL):
+        del _ssl_cache[key]
+        entry = None
+    return entry
+
+
+def detect_ssl_version(url, timeout=None):
+    """
+    Detect ssl version supported by the host, result is cached per host (see SSL_CACHE_FILE and SSL_CACHE_TTL),
+    failed detection is remembered for SSL_FAILURE_TTL
+
+    :param url:             any https url on the host
+    :param timeout:         timeout for probe requests
+    :return:                ssl protocol version or None if it could not be detected
+    """
+    key = _ssl_cache_key(url)
+    now = time()
+    with _ssl_cache_lock:
+        entry = _cached_ssl_version(key, now)
+        if entry is None:
+            _load_ssl_cache(now)
+            entry = _cached_ssl_version(key, now)
+        if entry is not None:
+            return entry[0]
+        host_lock = _ssl_host_locks.setdefault(key, threading.Lock())
+
+    # probing takes a while, so only requesters of the same host wait for each other
+    with host_lock:
+        with _ssl_cache_lock:
+            entry = _cached_ssl_version(key, time())
+        if entry is not None:
+            # somebody else has probed the host meanwhile
+            return entry[0]
+
+        # we do not know the host yet, so lets probe it with HEAD request to its root
+        detected = None
+        for SSLVer in SSLVers:
+            session = requests.session()
+            session.mount('https://', SSLAdapter(SSLVer))
+            try:
+                session.head('%s/' % key, timeout=timeout, allow_redirects=False)
+            except requests.exceptions.SSLError:
+                continue
+            finally:
+                session.close()
+            detected = SSLVer
+            break
+
+        with _ssl_cache_lock:
+            _ssl_cache[key] = (detected, time())
+            if detected is not None:
+                _store_ssl_cache()
+
+    if detected is None:
+        logger.warning(' Cannot detect SSL Version for %s' % key)
+    else:
+        logger.debug('Detected SSL Version: %s for %s' % (SSLVersStr[detected], key))
+    return detected
+
+
+_adapters = {}                      # {scheme://host:port: transport adapter with connection pool}
+_sessions = {}                      # {(scheme://host:port, credentials): requests session}
+_sessions_lock = threading.Lock()
+
+
+def configure_sessions(pool_connections=None, pool_maxsize=None, pool_block=None, keep_alive=None):
+    """
+    Tune connection pools of shared sessions, None keeps current value.
+    Sessions already in use are left untouched, new settings apply to sessions created afterwards.
+
+    :param int pool_connections:    number of cached connection pools per session
+    :param int pool_maxsize:        max connections kept in a pool
+    :param bool pool_block:         block when pool is exhausted instead of opening new connection
+    :param bool keep_alive:         reuse connections between requests
+    """
+    global POOL_CONNECTIONS, POOL_MAXSIZE, POOL_BLOCK, KEEP_ALIVE
+    with _sessions_lock:
+        POOL_CONNECTIONS = default(pool_connections, POOL_CONNECTIONS)
+        POOL_MAXSIZE = default(pool_maxsize, POOL_MAXSIZE)
+        POOL_BLOCK = default(pool_block, POOL_BLOCK)
+        KEEP_ALIVE = default(keep_alive, KEEP_ALIVE)
+        _adapters.clear()
+        _sessions.clear()
+
+
+def get_adapter(url, timeout=None):
+    """
+    Shared transport adapter for scheme and host of the url, all requesters talking to the same host
+    share its connection pool and so its warm connections.
+
+    :param url:             any url on the host
+    :param timeout:         timeout for ssl version detection
+    :return:                transport adapter
+    """
+    key = _ssl_cache_key(url)
+    with _sessions_lock:
+        if key in _adapters:
+            return _adapters[key]
+
+    # detection may take a while, so do it without holding the lock
+    pool = dict(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK)
+    if url.startswith('https://'):
+        adapter = SSLAdapter(detect_ssl_version(url, timeout=timeout), **pool)
+    else:
+        adapter = HTTPAdapter(**pool)
+
+    with _sessions_lock:
+        # somebody else might have been faster
+        return _adapters.setdefault(key, adapter)
+
+
+def get_session(url, timeout=None, auth=()):
+    """
+    Shared session for scheme and host of the url and credentials, so cookies (e.g. jenkins session)
+    are never shared between different users. Sessions of the same host share the connection pool
+    (see get_adapter).
+
+    :param url:             any url on the host
+    :param timeout:         timeout for ssl version detection
+    :param auth:            credentials used with the session, (username, password) or SimpleAuth
+    :return:                requests session
+    """
+    key = (_ssl_cache_key(url), tuple(auth) if auth else ())
+    with _sessions_lock:
+        if key in _sessions:
+            return _sessions[key]
+
+    adapter = get_adapter(url, timeout=timeout)
+    session = requests.session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not KEEP_ALIVE:
+        session.headers['Connection'] = 'close'
+
+    with _sessions_lock:
+        # somebody else might have been faster
+        return _sessions.setdefault(key, session)
+
 class SimpleAuth(object):
 
     def __init__(self, username=None, password=None):
@@ -148,13 +366,195 @@ class JenkinsAuth(object):
         return self.token == other.token and self.auth == other.auth
 
 
+class RetryPolicy(object):
+    """
+    Retry policy: exponential backoff with jitter, retry of idempotent requests on 5xx/429
+    honouring Retry-After and a retry budget per requester
+    """
+    def __init__(self, retries=RETRIES, backoff=RETRY_BACKOFF, max_wait=RETRY_WAIT, jitter=True,
+                 statuses=RETRY_STATUSES, budget=RETRY_BUDGET, budget_ratio=RETRY_BUDGET_RATIO):
+        """
+        :param int retries:         max retries of a single request
+        :param float backoff:       first backoff in seconds, doubled with each retry
+        :param float max_wait:      max backoff in seconds, longer Retry-After means no retry
+        :param bool jitter:         randomize backoff (full jitter), so clients do not retry in lockstep
+        :param tuple statuses:      HTTP statuses retried for idempotent requests (429 is retried always)
+        :param float budget:        max retries available to a requester at once
+        :param float budget_ratio:  each successful request returns this fraction of a retry to the budget
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+
+    def retry_status(self, status_code, idempotent=True):
+        """
+        :return bool:               True if response with status_code should be retried
+        """
+        if status_code == 429:
+            # too many requests, server did not process the request, so it is safe to repeat it
+            return 429 in self.statuses
+        return idempotent and status_code in self.statuses
+
+    def wait(self, attempt, response=None):
+        """
+        :param int attempt:         retry number, starting with 0
+        :param response:            response to be retried (for Retry-After), or None
+        :return float:              seconds to wait before retry, or None if we should not retry
+        """
+        if response is not None and 'retry-after' in response.headers:
+            retry_after = self.retry_after(response.headers['retry-after'])
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_wait else None
+        wait = min(self.max_wait, self.backoff * 2 ** attempt)
+        if self.jitter:
+            wait = uniform(0, wait)
+        return wait
+
+    @staticmethod
+    def retry_after(value):
+        """
+        :param str value:           Retry-After header, either delay in seconds or HTTP date
+        :return float:              seconds to wait or None if value cannot be parsed
+        """
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time())
+
+
+class RetryBudget(object):
+    """
+    Token bucket limiting retries, so an outage does not multiply load on the server
+    """
+    def __init__(self, size, ratio):
+        """
+        :param float size:          max tokens (retries) in the bucket
+        :param float ratio:         tokens returned to the bucket by every successful request
+        """
+        self._size = size
+        self._ratio = ratio
+        self._tokens = float(size)
+        self._lock = threading.Lock()
+
+    def withdraw(self):
+        """
+        :return bool:               True if retry is allowed
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._size, self._tokens + self._ratio)
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls, only the first caller does the work,
+    the others wait for it and receive the same result (or exception)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}          # {key: [event, result, exc_info]}
+
+    def do(self, key, fn):
+        """
+        :param key:             hashable key identifying the call
+        :param fn:              callable without arguments doing the real work
+        :return:                result of fn
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = [threading.Event(), None, None]
+
+        if not leader:
+            flight[0].wait()
+            if flight[2] is not None:
+                raise flight[2][0], flight[2][1], flight[2][2]
+            return flight[1]
+
+        try:
+            flight[1] = fn()
+            return flight[1]
+        except BaseException:
+            flight[2] = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight[0].set()
+
+
+_single_flight = SingleFlight()
+
+
+def _body_streams(kwargs):
+    """
+    :param dict kwargs:     request arguments
+    :return list:           [(stream, starting position)] of file-like objects sent in request body (data, files),
+                            None if some of them cannot be rewound, so the request cannot be repeated
+    """
+    values = [kwargs.get('data')]
+    files = kwargs.get('files')
+    if files:
+        for value in (files.values() if isinstance(files, dict) else [value for _, value in files]):
+            # value is either file object / content or tuple (filename, file object / content, ...)
+            values.append(value[1] if isinstance(value, (tuple, list)) else value)
+    streams = []
+    for value in values:
+        if not hasattr(value, 'read'):
+            continue
+        try:
+            streams.append((value, value.tell()))
+        except (AttributeError, IOError, OSError):
+            return None
+    return streams
+
+
+def _rewind(streams):
+    """
+    :param list streams:    result of _body_streams
+    :return bool:           True if all streams are back on their starting position
+    """
+    if streams is None:
+        return False
+    try:
+        for stream, position in streams:
+            stream.seek(position)
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+    return True
+
+
 class Requester(object):
     """
     Object requesting data
     """
     def __init__(self, url, username=None, password=None, params=None, headers=None,
-                 cookies=None, timeout=None, session=None):
+                 cookies=None, timeout=None, session=None, retry=None, owner=None):
+        """
+        :param RetryPolicy retry:   retry policy, default RetryPolicy()
+        :param str owner:           name of requesting object class, used by instrumentation hooks
+        """
         self._url = url
+        self._owner = owner
         self._auth = ()
         if username is not None:
             self._auth = SimpleAuth(username=username)
@@ -165,50 +565,111 @@ class Requester(object):
         self._params = default(params, {})
         self._headers = default(headers, {})
         self._cookies = default(cookies, {})
+        self._retry = default(retry, RetryPolicy())
+        self._budget = RetryBudget(self._retry.budget, self._retry.budget_ratio)
 
         if session is None:
-            # create request session object and try to auto detect proper ssl version
-            self._session = requests.session()
-            if self._url.startswith('https://'):
-                SSLVer = None
-                for SSLVer in SSLVers:
-                    try:
-                        self._session = requests.session()
-                        self._session.mount('https://', SSLAdapter(SSLVer))
-                        self._session.get(self._url)
-                        break
-                    except requests.exceptions.SSLError:
-                        continue
-                logger.debug('Detected SSL Version: %s' % SSLVersStr[SSLVer])
+            # use shared session (with proper auto detected ssl version) for the host and credentials
+            self._session = get_session(self._url, timeout=self._timeout, auth=self._auth)
         else:
             self._session = session
 
-    def get(self, url=None, params=None, headers=None, cookies=None, auth=None):
+    def _request(self, method, url, idempotent, **kwargs):
+        """
+        Issue request, retry it according to retry policy and report it to instrumentation hooks
+        :param bool idempotent:     if False, request is retried only if it surely has not been processed
+        :return:                    response
+        """
+        info = {'method': method, 'url': url, 'owner': self._owner, 'start': time(), 'retries': 0, 'sleep': 0.0}
+        instrumented = jenkinsapi.metrics.hooks_enabled()
+        if instrumented:
+            info['template'] = jenkinsapi.metrics.url_template(url)
+            jenkinsapi.metrics.call_hooks('pre_request', info)
+        try:
+            response = self._retry_request(method, url, idempotent, info, **kwargs)
+        except Exception as e:
+            if instrumented:
+                info.update(status=None, elapsed=time() - info['start'], bytes=None, error=e)
+                jenkinsapi.metrics.call_hooks('post_request', info)
+            raise
+        if instrumented:
+            if kwargs.get('stream'):
+                # we do not want to consume streamed content here
+                size = response.headers.get('content-length')
+                size = int(size) if size is not None and size.isdigit() else None
+            else:
+                size = len(response.content)
+            info.update(status=response.status_code, elapsed=time() - info['start'], bytes=size, error=None)
+            jenkinsapi.metrics.call_hooks('post_request', info)
+        return response
+
+    def _retry_request(self, method, url, idempotent, info, **kwargs):
+        """
+        Issue request, retry it according to retry policy
+        :param dict info:           retries and sleep are accounted there
+        :return:                    response
+        """
+        attempt = 0
+        # uploaded files were consumed by the previous attempt, they must be rewound before retry
+        streams = _body_streams(kwargs)
+        while True:
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except (ZeroReturnError, requests.exceptions.ConnectionError) as e:
+                # request might have reached the server, unless we could not even connect
+                if not idempotent and not isinstance(e, requests.exceptions.ConnectTimeout):
+                    raise
+                if attempt >= self._retry.retries or not _rewind(streams) or not self._budget.withdraw():
+                    raise
+                wait = self._retry.wait(attempt)
+                logger.warning(' caught %s for %s, retry in %.1fs' % (e.__class__.__name__, url, wait))
+                sleep(wait)
+                attempt += 1
+                info['retries'] += 1
+                info['sleep'] += wait
+                continue
+
+            if self._retry.retry_status(response.status_code, idempotent) and attempt < self._retry.retries:
+                wait = self._retry.wait(attempt, response)
+                if wait is not None and _rewind(streams) and self._budget.withdraw():
+                    logger.warning(' got HTTP %d for %s, retry in %.1fs' % (response.status_code, url, wait))
+                    response.close()
+                    sleep(wait)
+                    attempt += 1
+                    info['retries'] += 1
+                    info['sleep'] += wait
+                    continue
+            self._budget.deposit()
+            return response
+
+    def get(self, url=None, params=None, headers=None, cookies=None, auth=None, coalesce=True):
+        """
+        :param bool coalesce:       share response with identical GETs already in flight (in any thread)
+        """
         logger.debug('GET: %s' % default(url, self._url))
-        # workaround for unreliable network and servers, giwe it few retries
+        kwargs = dict(
+            url=default(url, self._url),
+            params=merge_all_dict(self._params, params),
+            cookies=merge_all_dict(self._cookies, cookies),
+            headers=merge_all_dict(self._headers, headers),
+            auth=last_not_none(self._auth, auth),
+            timeout=self._timeout)
+        fn = lambda: self._request('GET', idempotent=True, **kwargs)
 
-        for i in range(RETRIES):
+        key = None
+        if coalesce:
             try:
-                request = self._session.get(
-                    url=default(url, self._url),
-                    params=merge_all_dict(self._params, params),
-                    cookies=merge_all_dict(self._cookies, cookies),
-                    headers=merge_all_dict(self._headers, headers),
-                    auth=last_not_none(self._auth, auth),
-                    timeout=self._timeout)
-            except (ZeroReturnError, requests.exceptions.ConnectionError):
-                logger.warning(' caught ZeroReturnError for %s' % default(url, self._url))
-                sleep(RETRY_WAIT)
-                continue
-            except:
-                # other error, just re-rise
-                raise
-            # all ok, so continue
-            break
+                key = (kwargs['url'], tuple(sorted(kwargs['params'].items())), tuple(sorted(kwargs['cookies'].items())),
+                       tuple(sorted(kwargs['headers'].items())), tuple(kwargs['auth']))
+                hash(key)
+            except TypeError:
+                # unhashable parameters, lets do the request on our own
+                key = None
+        request = fn() if key is None else _single_flight.do(key, fn)
 
         if not request.ok:
             raise IOError('HTTPStatus: %s\nCannot get %s.' % (request.status_code, url))
-        logger.debug('GET:response: %s' % request.content)
+        logger.debug('GET:response: %d bytes' % len(request.content))
         return request
 
     def iterget(self, url=None, params=None, headers=None, cookies=None, auth=None, blocksize=None):
@@ -219,37 +680,36 @@ class Requester(object):
             # lets try 1kB chunks
             blocksize = 1024
 
-        for i in range(RETRIES):
-            try:
-                request = self._session.get(
-                    url=default(url, self._url),
-                    params=merge_all_dict(self._params, params),
-                    cookies=merge_all_dict(self._cookies, cookies),
-                    headers=merge_all_dict(self._headers, headers),
-                    auth=last_not_none(self._auth, auth),
-                    timeout=self._timeout,
-                    stream=True)
-            except (ZeroReturnError, requests.exceptions.ConnectionError):
-                logger.warning(' caught ZeroReturnError for %s' % default(url, self._url))
-                sleep(RETRY_WAIT)
-                continue
-            except:
-                # other error, just re-rise
-                raise
-            # all ok, so continue
-            break
+        request = self._request(
+            'GET',
+            url=default(url, self._url),
+            idempotent=True,
+            params=merge_all_dict(self._params, params),
+            cookies=merge_all_dict(self._cookies, cookies),
+            headers=merge_all_dict(self._headers, headers),
+            auth=last_not_none(self._auth, auth),
+            timeout=self._timeout,
+            stream=True)
 
         if not request.ok:
             raise IOError('HTTPStatus: %s\nCannot get %s.' % (request.status_code, url))
         logger.debug('GET_(iterator):response: %s' % 'OK')
         return request.iter_content(blocksize)
 
-    def post(self, url=None, params=None, data=None, headers=None, cookies=None, auth=None, files=None):
+    def post(self, url=None, params=None, data=None, headers=None, cookies=None, auth=None, files=None,
+             idempotent=False, stream=False):
+        """
+        :param bool idempotent:     True if request can be safely repeated (e.g. it only reads data)
+        :param bool stream:         do not download response body at once, caller consumes it
+                                    by response.iter_content and must close the response
+        """
         logger.debug('POST: %s' % default(url, self._url))
         logger.debug('POST:params: %s' % str(params))
         logger.debug('POST:data: %s' % str(data))
-        request = self._session.post(
+        request = self._request(
+            'POST',
             url=default(url, self._url),
+            idempotent=idempotent,
             params=merge_all_dict(self._params, params),
             cookies=merge_all_dict(self._cookies, cookies),
             #headers=merge_all_dict({'Content-Type': 'multipart/form-data'}, self._headers, headers),
@@ -257,7 +717,8 @@ class Requester(object):
             auth=last_not_none(self._auth, auth),
             data=last_not_none('', data),
             files=files,
-            timeout=self._timeout
+            timeout=self._timeout,
+            stream=stream
         )
         return request
 
@@ -275,4 +736,12 @@ class Requester(object):
 
     @property
     def session(self):
-        return self._session
\ No newline at end of file
+        return self._session
+
+    @property
+    def retry(self):
+        return self._retry
+
+    @property
+    def budget(self):
+        return self._budget
@@ -0,0 +1,230 @@
+import threading
+import time
+import weakref
+from multiprocessing.pool import ThreadPool
+
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = 'sedlacek'
+
+_installed = None               # scheduler owning all new objects with poll_interval
+_executor = None                # default executor of change callbacks
+_executor_lock = threading.Lock()
+
+
+def install(scheduler):
+    """
+    Make scheduler owner of all API objects with poll_interval created from now on
+    :param PollScheduler scheduler:     started scheduler or None to stop automatic registration
+    :return:                            scheduler
+    """
+    global _installed
+    _installed = scheduler
+    return scheduler
+
+
+def installed():
+    """
+    :return PollScheduler:      installed scheduler or None
+    """
+    return _installed
+
+
+def default_executor():
+    """
+    :return CallbackExecutor:   shared executor of change callbacks, created on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = CallbackExecutor()
+        return _executor
+
+
+class InlineExecutor(object):
+    """
+    Runs callbacks immediately in the polling thread, callbacks must be fast
+    """
+
+    @staticmethod
+    def submit(fn, *args, **kwargs):
+        # noinspection PyBroadException
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception(' Callback %r failed' % fn)
+
+
+class CallbackExecutor(object):
+    """
+    Runs callbacks in a pool of background threads, so they never block the poller
+
+    Any object with submit(fn, *args, **kwargs) method (e.g. concurrent.futures executor) can be used instead.
+    """
+
+    def __init__(self, workers=1):
+        """
+        :param int workers:         number of callback threads, single thread keeps callbacks ordered
+        """
+        self._workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self._workers)
+            pool = self._pool
+        pool.apply_async(InlineExecutor.submit, (fn,) + args, kwargs)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            if wait:
+                pool.join()
+
+
+class PollScheduler(object):
+    """
+    Refreshes registered objects having poll_interval in the background
+
+    Due objects are refreshed in batches by a pool of workers. Object whose data are delivered
+    by its parent's payload (stubs, queue items) is not polled, when the parent is refreshed in the same batch
+    and parent's payload still contains it.
+    Reads of registered objects are served from last polled data, without network calls.
+
+    Usage:
+        scheduler = jenkinsapi.scheduler.install(jenkinsapi.scheduler.PollScheduler(workers=8).start())
+        jenkins = Jenkins(url=..., poll_interval=30)
+        ...
+        scheduler.stop()
+    """
+
+    def __init__(self, workers=4, tick=0.5, batch=None):
+        """
+        :param int workers:         number of polling threads
+        :param float tick:          how often (in seconds) we look for due objects
+        :param int batch:           max objects refreshed in one tick, None means all due objects
+        """
+        self._workers = workers
+        self._tick = tick
+        self._batch = batch
+        self._objects = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def register(self, obj):
+        """
+        :param JenkinsBase obj:     object to be refreshed by scheduler
+        :return:                    obj
+        """
+        with self._lock:
+            self._objects.add(obj)
+        obj._scheduler = self
+        return obj
+
+    def unregister(self, obj):
+        with self._lock:
+            self._objects.discard(obj)
+        obj._scheduler = None
+        return obj
+
+    def __contains__(self, obj):
+        with self._lock:
+            return obj in self._objects
+
+    def __len__(self):
+        with self._lock:
+            return len(self._objects)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._pool = ThreadPool(self._workers)
+            self._thread = threading.Thread(target=self._run, name='jenkinsapi-scheduler')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        return self
+
+    def due(self, now=None):
+        """
+        :return list:               registered objects which should be refreshed, most overdue first
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            objects = list(self._objects)
+        due = [obj for obj in objects if obj.poll_interval is not None and obj._next_poll <= now]
+        due.sort(key=lambda obj: obj._next_poll)
+        return due
+
+    def merge(self, due):
+        """
+        Drop objects which get their data from parent's payload, when the parent is due as well
+        or parent is scheduled to be refreshed at least as often as the object. Objects which are
+        no more in parent's payload (e.g. queue item which has left the queue) are polled on their own.
+        :param list due:            due objects
+        :return list:               objects to be really polled
+        """
+        ids = set(id(obj) for obj in due)
+        result = []
+        for obj in due:
+            if obj.refreshed_by_parent:
+                parent = obj.parent
+                if id(parent) in ids:
+                    continue
+                if getattr(parent, '_scheduler', None) is self and parent.poll_interval <= obj.poll_interval:
+                    continue
+            result.append(obj)
+        return result
+
+    def refresh(self, now=None):
+        """
+        Refresh due objects (single tick)
+        :return int:                number of polled objects
+        """
+        if now is None:
+            now = time.time()
+        due = self.due(now)
+        if self._batch is not None:
+            due = due[:self._batch]
+        topoll = self.merge(due)
+        if topoll:
+            if self._pool is not None:
+                self._pool.map(self._refresh, topoll)
+            else:
+                map(self._refresh, topoll)
+        # merged objects got fresh data from the parent (or parent's payload has not changed)
+        polled = set(id(obj) for obj in topoll)
+        for obj in due:
+            if id(obj) not in polled:
+                obj._update_poll(now)
+        return len(topoll)
+
+    @staticmethod
+    def _refresh(obj):
+        # noinspection PyBroadException
+        try:
+            obj.poll()
+        except Exception:
+            logger.exception(' Scheduled poll of %r failed' % obj)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self._tick)